@@ -0,0 +1,47 @@
+# Checks the moving averages against the original per-day loop, on prices that stay flat.
+import contextlib
+import io
+import numpy as np
+import pytest
+from trading import indicators as ind
+from trading import process as proc
+from trading import streaming
+from trading import strategy as strat
+
+def _loop_moving_average(stock_price, n):
+    '''
+    The original moving_average(): np.average of the n days before each day.
+    '''
+    ma = np.full(len(stock_price), np.nan)
+    for i in range(n, len(stock_price)):
+        ma[i] = np.average(stock_price[i-n:i])
+    return ma
+
+@pytest.fixture(scope='module')
+def flat_prices():
+    #random walk for 200 days, then each price is held flat
+    rng = np.random.default_rng(3)
+    prices = 100 + np.cumsum(rng.normal(0, 1, (400, 6)), axis=0)
+    prices[200:] = prices[199]
+    return prices
+
+@pytest.mark.parametrize('n', [7, 10, 30, 50])
+def test_matches_loop(flat_prices, n):
+    ma = ind.moving_averages(flat_prices, n)
+    for stock in range(flat_prices.shape[1]):
+        assert np.array_equal(ma[:, stock], _loop_moving_average(flat_prices[:, stock], n), equal_nan=True)
+
+@pytest.mark.parametrize('n', [10, 30])
+def test_streaming_matches_batch(flat_prices, n):
+    average = streaming.MovingAverage(n)
+    ma = np.array([average.update(prices) for prices in flat_prices])
+    assert np.array_equal(ma, ind.moving_averages(flat_prices, n), equal_nan=True)
+
+def test_no_trades_in_flat_stretch(flat_prices):
+    #once both windows are in the flat stretch, the averages must not cross
+    ledger = proc.LedgerWriter(None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        strat.crossing_averages(flat_prices, n=10, m=30, ledger=ledger)
+    dates = ledger.transactions()['date']
+    #the last day is only the final sale of every stock
+    assert not np.any((dates >= 230) & (dates < len(flat_prices) - 1))
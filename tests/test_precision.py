@@ -0,0 +1,62 @@
+# Checks that the float32 mode of the strategies trades (almost) like the float64 mode.
+import contextlib
+import io
+import numpy as np
+import pytest
+from trading import data
+from trading import process as proc
+from trading import strategy as strat
+
+#largest relative difference allowed between the float32 and float64 runs: in the number
+#of trades (an indicator at a threshold can flip a trade), and in the profit, relative to
+#the total value traded
+MAX_TRADES_DIFF = 0.01
+MAX_PROFIT_DIFF = 1e-3
+
+#strategy, keyword arguments
+CASES = [
+    ('crossing_averages', {'n': 20, 'm': 50}),
+    ('crossing_averages', {'n': 10, 'm': 30, 'weights_n': list(range(1, 11)), 'weights_m': [1] * 30}),
+    ('momentum', {'osc_type': 'stochastic'}),
+    ('momentum', {'osc_type': 'RSI'}),
+]
+
+@pytest.fixture(scope='module', params=[0, 1, 2])
+def stock_prices(request):
+    rng = np.random.default_rng(request.param)
+    return data.generate_stock_price(1000, rng.uniform(5, 200, 50), rng.uniform(0.1, 1, 50), seed=request.param)
+
+def _run(strategy, stock_prices, **kwargs):
+    '''
+    Runs a strategy with an in-memory ledger, and returns its number of trades,
+    its profit and the total value traded.
+    '''
+    ledger = proc.LedgerWriter(None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        getattr(strat, strategy)(stock_prices, ledger=ledger, **kwargs)
+    transactions = ledger.transactions()
+    total = (-transactions['number_of_shares'] * transactions['price']) - transactions['fees']
+    return len(transactions), total.sum(), np.abs(total).sum()
+
+def _check(run64, run32):
+    trades64, profit64, traded64 = run64
+    trades32, profit32, traded32 = run32
+    assert trades64 > 0
+    assert abs(trades32 - trades64) <= MAX_TRADES_DIFF * trades64
+    assert abs(profit32 - profit64) <= MAX_PROFIT_DIFF * traded64
+
+@pytest.mark.parametrize('strategy, kwargs', CASES)
+def test_float32_matches_float64(stock_prices, strategy, kwargs):
+    run64 = _run(strategy, stock_prices, **kwargs)
+    run32 = _run(strategy, stock_prices, dtype=np.float32, **kwargs)
+    _check(run64, run32)
+
+def test_random_float32_prices(stock_prices):
+    #random has no dtype argument, so it is given float32 prices
+    np.random.seed(0)
+    run64 = _run('random', stock_prices)
+    np.random.seed(0)
+    run32 = _run('random', stock_prices.astype(np.float32))
+    _check(run64, run32)
+    #the trades are drawn from the seed only, so they are the same
+    assert run32[0] == run64[0]
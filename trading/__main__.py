@@ -0,0 +1,99 @@
+# Batch runner for the strategies, run with: python -m trading <batch file>
+#
+# The batch file is JSON, with the get_data() arguments under "data" and one strategy
+# configuration per run under "runs", e.g.
+#     {"data": {"method": "read", "data_file": "stock_data_5y.txt", "initial_price": [10, 50, 100]},
+#      "runs": [{"strategy": "crossing_averages", "n": 20, "m": 100},
+#               {"strategy": "momentum", "osc_type": "RSI", "ledger": "ledger_rsi.txt"},
+#               {"strategy": "random", "seed": 1}]}
+# A run is named by its "name" (default: strategy and run number), "seed" seeds numpy's
+# global generator before it starts (for the random strategy), and any other keys are
+# passed to the strategy. Runs with a "ledger" path write and read back their ledger file,
+# the others keep their ledger in memory.
+import argparse
+import json
+import sys
+import numpy as np
+from trading import data
+from trading import process as proc
+from trading import performance as perf
+from trading import strategy as strat
+
+STRATEGIES = ('random', 'crossing_averages', 'momentum')
+
+def load_batch(batch_file):
+    '''
+    Reads a batch file (see the top of this module).
+
+    Input:
+        batch_file (str): path to the JSON batch file, or '-' to read it from stdin
+
+    Output:
+        data_args (dict): get_data() arguments
+        runs (list): one dict per run, with at least 'strategy'
+    '''
+    if batch_file == '-':
+        batch = json.load(sys.stdin)
+    else:
+        with open(batch_file) as f:
+            batch = json.load(f)
+    #a plain list is a batch of runs on the default data
+    if isinstance(batch, list):
+        batch = {'runs': batch}
+    runs = batch.get('runs', [])
+    for i, run in enumerate(runs):
+        if run.get('strategy') not in STRATEGIES:
+            raise ValueError(f'Run {i}: strategy must be one of {", ".join(STRATEGIES)}, not {run.get("strategy")!r}')
+    return dict(batch.get('data', {})), runs
+
+def run_batch(data_args, runs):
+    '''
+    Loads the price data once and runs every strategy configuration on it, printing
+    the results of each run as read_ledger() does.
+
+    Input:
+        data_args (dict): get_data() arguments ('dtype' may be a name, e.g. 'float32')
+        runs (list): one dict per run (see the top of this module)
+
+    Output:
+        results (list): (name, summary) for each run, in order, where summary is as
+            returned by performance.ledger_summary()
+    '''
+    stock_prices = data.get_data(**data_args)
+    if stock_prices is None:
+        return []
+    results = []
+    for i, run in enumerate(runs):
+        config = dict(run)
+        strategy = config.pop('strategy')
+        name = config.pop('name', f'{strategy} #{i}')
+        seed = config.pop('seed', None)
+        if seed is not None:
+            np.random.seed(seed)
+        ledger_file = config.pop('ledger', None)
+        if ledger_file is None:
+            ledger = proc.LedgerWriter(None)
+            getattr(strat, strategy)(stock_prices, ledger=ledger, **config)
+            summary = perf.transactions_summary(ledger.transactions())
+        else:
+            getattr(strat, strategy)(stock_prices, ledger=ledger_file, **config)
+            summary = perf.ledger_summary(ledger_file)
+        perf.print_summary(name, summary)
+        results.append((name, summary))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m trading',
+                                     description='Run a batch of strategy configurations on the same price data.')
+    parser.add_argument('batch_file', help="JSON batch file ('-' for stdin)")
+    parser.add_argument('--data-file', help='overrides the data_file of the batch')
+    args = parser.parse_args(argv)
+
+    data_args, runs = load_batch(args.batch_file)
+    if args.data_file is not None:
+        data_args['data_file'] = args.data_file
+    results = run_batch(data_args, runs)
+    return 0 if len(results) == len(runs) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+# Benchmarks for the trading package, run with: python -m trading.benchmark --help
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from trading import data
+from trading import indicators as ind
+from trading import process as proc
+from trading import performance as perf
+from trading import strategy as strat
+from trading.cache import indicator_cache
+
+#(days, stocks) sizes benchmarked by default
+DEFAULT_SIZES = [(1825, 10), (1825, 100), (3650, 1000), (7300, 5000)]
+
+def _measure(func, repeat):
+    '''
+    Runs func repeat times and returns the best wall time (seconds), then runs it once
+    more with tracemalloc to get its peak memory (bytes). The strategies' indicator cache
+    is emptied before every run, so each run computes its indicators from scratch.
+    '''
+    times = []
+    for _ in range(repeat):
+        indicator_cache.clear()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    indicator_cache.clear()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+def _cases(days, stocks, workdir, only=None):
+    '''
+    Sets up the data for one size and returns the benchmark cases as (name, func, extra),
+    where extra holds any additional numbers to report (e.g. the number of trades).
+    Only the cases named in only are returned (all of them if None), and only the data
+    those cases need is set up.
+    '''
+    def selected(*names):
+        return only is None or any(name in only for name in names)
+
+    rng = np.random.default_rng(0)
+    initial_price = rng.uniform(10, 200, stocks)
+    volatility = rng.uniform(0.1, 1, stocks)
+    #number of transactions for the ledger benchmarks
+    trades = min(100 * stocks, 100000)
+    dates = rng.integers(0, days, trades)
+    held = rng.integers(0, stocks, trades)
+    cases = [('generate_stock_price', lambda: data.generate_stock_price(days, initial_price, volatility, seed=0), {})]
+    #every other case runs on the same generated prices
+    if only is not None and set(only) <= {'generate_stock_price'}:
+        return [case for case in cases if selected(case[0])]
+    stock_prices = data.generate_stock_price(days, initial_price, volatility, seed=0)
+
+    if selected('get_data_cold', 'get_data'):
+        data_file = os.path.join(workdir, 'stock_data_5y.txt')
+        np.savetxt(data_file, np.vstack([volatility, stock_prices]))
+
+        def get_data_cold():
+            for path in data._cache_paths(data_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            data.get_data(volatility=volatility[:10].tolist(), data_file=data_file)
+
+        cases += [
+            ('get_data_cold', get_data_cold, {}),
+            ('get_data', lambda: data.get_data(volatility=volatility[:10].tolist(), data_file=data_file), {}),
+        ]
+
+    def random():
+        np.random.seed(0)
+        strat.random(stock_prices, ledger=os.path.join(workdir, 'ledger_random.txt'))
+
+    cases += [
+        ('moving_average', lambda: ind.moving_averages(stock_prices, 50), {}),
+        ('moving_average_float32', lambda: ind.moving_averages(stock_prices, 50, dtype=np.float32), {}),
+        ('moving_average_weighted', lambda: ind.moving_averages(stock_prices, 50, np.linspace(0, 2, 50)), {}),
+        ('oscillator_stochastic', lambda: ind.oscillators(stock_prices, 7, 'stochastic'), {}),
+        ('oscillator_RSI', lambda: ind.oscillators(stock_prices, 7, 'RSI'), {}),
+        ('random', random, {}),
+        ('crossing_averages', lambda: strat.crossing_averages(stock_prices, ledger=os.path.join(workdir, 'ledger_crossing_averages.txt')), {}),
+        ('momentum', lambda: strat.momentum(stock_prices, ledger=os.path.join(workdir, 'ledger_momentum.txt')), {}),
+        ('momentum_float32', lambda: strat.momentum(stock_prices, ledger=os.path.join(workdir, 'ledger_momentum.txt'), dtype=np.float32), {}),
+    ]
+
+    ledger = os.path.join(workdir, 'ledger.txt')
+
+    def log_transaction():
+        if os.path.exists(ledger):
+            os.remove(ledger)
+        for date, stock in zip(dates.tolist(), held.tolist()):
+            proc.log_transaction('buy', date, stock, 10, stock_prices[date][stock], 20, ledger)
+
+    def ledger_writer():
+        if os.path.exists(ledger):
+            os.remove(ledger)
+        with proc.LedgerWriter(ledger) as writer:
+            for date, stock in zip(dates.tolist(), held.tolist()):
+                writer.log('buy', date, stock, 10, stock_prices[date][stock], 20)
+
+    cases += [
+        ('log_transaction', log_transaction, {'trades': trades}),
+        ('ledger_writer', ledger_writer, {'trades': trades}),
+    ]
+
+    if selected('read_ledger'):
+        #ledger read by the read_ledger case, written once here so that case runs on its own
+        read_ledger_file = os.path.join(workdir, 'ledger_read.txt')
+        if os.path.exists(read_ledger_file):
+            os.remove(read_ledger_file)
+        with proc.LedgerWriter(read_ledger_file) as writer:
+            writer.log_many('buy', dates, held, np.full(trades, 10), stock_prices[dates, held], 20)
+        cases.append(('read_ledger', lambda: perf.read_ledger(read_ledger_file), {'trades': trades}))
+
+    return [case for case in cases if selected(case[0])]
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, only=None):
+    '''
+    Times the hot paths of the trading package over a grid of data sizes.
+
+    Input:
+        sizes (list, default DEFAULT_SIZES): (days, stocks) sizes to benchmark
+        repeat (int, default 3): number of timed runs of each case (the best is kept)
+        only (list, default None): names of the cases to run, all of them if None
+
+    Output:
+        report (dict): 'meta' (versions, date) and 'results', a list with the name,
+            days, stocks, best time ('seconds') and peak memory ('peak_bytes') of each case
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, 'w') as devnull:
+        for days, stocks in sizes:
+            for name, func, extra in _cases(days, stocks, workdir, only):
+                #silence the messages printed by the functions being timed
+                with contextlib.redirect_stdout(devnull):
+                    seconds, peak = _measure(func, repeat)
+                results.append(dict(name=name, days=days, stocks=stocks, seconds=seconds,
+                                    peak_bytes=peak, **extra))
+                print(f'{name} ({days}x{stocks}): {seconds:.4f}s, peak {peak / 2**20:.1f} MiB')
+    meta = {'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'repeat': repeat}
+    return {'meta': meta, 'results': results}
+
+def compare(report, baseline, threshold=0.1):
+    '''
+    Flags the cases that got slower than in a saved baseline report.
+
+    Input:
+        report (dict): the current report, from run_benchmarks()
+        baseline (dict): the saved baseline report
+        threshold (float, default 0.1): relative slowdown allowed before a case is flagged
+
+    Output:
+        regressions (list): name, days, stocks, seconds, baseline_seconds and ratio
+            of each case slower than baseline * (1 + threshold)
+    '''
+    saved = {(r['name'], r['days'], r['stocks']): r['seconds'] for r in baseline['results']}
+    regressions = []
+    for r in report['results']:
+        key = (r['name'], r['days'], r['stocks'])
+        if key in saved and r['seconds'] > saved[key] * (1 + threshold):
+            regressions.append({'name': r['name'], 'days': r['days'], 'stocks': r['stocks'],
+                                'seconds': r['seconds'], 'baseline_seconds': saved[key],
+                                'ratio': r['seconds'] / saved[key]})
+    return regressions
+
+def _parse_size(text):
+    days, stocks = text.lower().split('x')
+    return int(days), int(stocks)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m trading.benchmark',
+                                     description='Benchmark the trading package over data sizes.')
+    parser.add_argument('--sizes', type=_parse_size, nargs='+', default=DEFAULT_SIZES,
+                        help='(days)x(stocks) sizes, e.g. 1825x10 7300x5000')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (best is kept)')
+    parser.add_argument('--only', nargs='+', help='names of the cases to run')
+    parser.add_argument('--output', default='benchmark.json', help='path of the JSON report')
+    parser.add_argument('--compare', help='baseline JSON report to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown allowed')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.repeat, args.only)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for r in regressions:
+            print(f'REGRESSION {r["name"]} ({r["days"]}x{r["stocks"]}): {r["seconds"]:.4f}s'
+                  f' vs {r["baseline_seconds"]:.4f}s ({r["ratio"]:.2f}x)')
+        if regressions:
+            return 1
+        print('No regressions.')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
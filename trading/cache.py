@@ -0,0 +1,111 @@
+# Memoizing cache for the indicators, shared across strategy runs.
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from trading import indicators as ind
+from trading import instrument
+
+class IndicatorCache:
+    '''
+    Least recently used cache of indicator results, one entry per stock. An entry is keyed
+    by a fingerprint of the stock's price column, the indicator and its parameters, so
+    repeated runs on the same data (e.g. changing only the cool-off or the amount) reuse
+    the indicators computed before.
+
+    Input:
+        max_bytes (int, default 256 MiB): memory budget for the cached results, the least
+            recently used entries are evicted above it (0 disables the cache)
+    '''
+
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        '''
+        Removes all cached results.
+        '''
+        self.entries.clear()
+        self.nbytes = 0
+
+    def set_memory_budget(self, max_bytes):
+        '''
+        Changes the memory budget, evicting entries if needed (0 disables the cache).
+        '''
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def _evict(self):
+        while self.entries and self.nbytes > self.max_bytes:
+            _, values = self.entries.popitem(last=False)
+            self.nbytes -= values.nbytes
+
+    def _store(self, key, values):
+        if values.nbytes > self.max_bytes:
+            return None
+        values.flags.writeable = False
+        self.entries[key] = values
+        self.nbytes += values.nbytes
+        self._evict()
+
+    def _get(self, func, stock_prices, params):
+        '''
+        Returns func(stock_prices, *params), computing it only for the stocks not in the cache.
+        '''
+        #disabled cache: no fingerprints or copies, nothing could ever be stored
+        if self.max_bytes <= 0:
+            return func(stock_prices, *params)
+        stock_prices = np.asarray(stock_prices)
+        single = stock_prices.ndim == 1
+        if single:
+            stock_prices = stock_prices[:, None]
+        #fingerprint of each price column, with the indicator and its parameters
+        keys = []
+        for column in stock_prices.T:
+            fingerprint = hashlib.blake2b(np.ascontiguousarray(column).tobytes(), digest_size=16)
+            fingerprint.update(column.dtype.str.encode())
+            keys.append((fingerprint.digest(), func.__name__, params))
+        columns = [None] * len(keys)
+        missing = []
+        for j, key in enumerate(keys):
+            values = self.entries.get(key)
+            if values is None:
+                missing.append(j)
+            else:
+                self.entries.move_to_end(key)
+                columns[j] = values
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if instrument.enabled:
+            instrument.count('indicator_cache.hits', len(keys) - len(missing))
+            instrument.count('indicator_cache.misses', len(missing))
+        if missing:
+            #computes the missing stocks together, in one batched call
+            computed = func(stock_prices[:, missing], *params)
+            for k, j in enumerate(missing):
+                columns[j] = computed[:, k].copy()
+                self._store(keys[j], columns[j])
+        if single:
+            return columns[0].copy()
+        return np.stack(columns, axis=1) if columns else np.zeros(stock_prices.shape)
+
+    def moving_averages(self, stock_prices, n=7, weights=[], ma_type='simple', dtype=None):
+        '''
+        Cached indicators.moving_averages() (same inputs and output).
+        '''
+        weights = tuple(np.asarray(weights, dtype=float).tolist())
+        dtype = None if dtype is None else np.dtype(dtype).str
+        return self._get(ind.moving_averages, stock_prices, (n, weights, ma_type, dtype))
+
+    def oscillators(self, stock_prices, n=7, osc_type='stochastic', smoothing='simple', dtype=None):
+        '''
+        Cached indicators.oscillators() (same inputs and output).
+        '''
+        dtype = None if dtype is None else np.dtype(dtype).str
+        return self._get(ind.oscillators, stock_prices, (n, osc_type, smoothing, dtype))
+
+#cache used by the strategies, change its budget with indicator_cache.set_memory_budget()
+indicator_cache = IndicatorCache()
@@ -1,58 +1,197 @@
 import numpy as np
+import os
+import tempfile
 
-def generate_stock_price(days, initial_price, volatility):
+def generate_stock_paths(days, initial_price, volatility, paths=1, seed=None, dtype=np.float64):
+    '''
+    Generates many independent share price paths at once for a given number of
+    companies, with a given initial price and volatility, using the same model
+    as generate_stock_price().
+
+    Input:
+        days (int): number of days to generate
+        initial_price (list): initial price for each stock
+        volatility (list): volatility for each stock
+        paths (int, default 1): number of Monte Carlo paths to generate
+        seed (int, default None): seed for the random generator, for repeatable paths
+        dtype (default np.float64): dtype of the returned prices, e.g. np.float32 to halve
+            their memory. Each path is computed in float64 and then stored as dtype.
+
+    Output: stock_prices (ndarray): the generated stock price data with
+        shape (paths, days, stocks)
+    '''
+
+    initial_price = np.asarray(initial_price, dtype=float)
+    volatility = np.asarray(volatility, dtype=float)
+    #number of companies
+    n = len(initial_price)
+    #using numpy to set up a (seeded) random generator
+    rng = np.random.default_rng(seed)
+    #probabilty of news each day 1%, there is no news on day 0
+    news = rng.random((paths, days)) < 0.01
+    news[:, 0] = False
+    path_idx, day_idx = np.nonzero(news)
+    #randomly generated the event to last between 3 to 14 days, if it happens
+    duration = rng.integers(3, 14, size=len(day_idx))
+    #m with normal distrubution(0,4) for each company, for each event
+    m = rng.normal(0, 4, size=(len(day_idx), n)) * volatility
+    stock_prices = np.empty((paths, days, n), dtype=dtype)
+    #one path at a time, so only one path is ever held in float64
+    for p in range(paths):
+        events = path_idx == p
+        #drift is built as a difference array: the drift starts on the news day and is removed
+        #once the event ends, allows for max duration (14 days) to avoid errors
+        drift = np.zeros((days + 14, n))
+        np.add.at(drift, day_idx[events], m[events])
+        np.add.at(drift, day_idx[events] + duration[events], -m[events])
+        #increment with normal distrubtuion(0,volatility^2), drift added on top
+        prices = rng.normal(0, volatility**2, size=(days, n))
+        prices += np.cumsum(drift[:days], axis=0)
+        #first row is initial price, every following day adds its increment and drift
+        prices[0] = initial_price
+        np.cumsum(prices, axis=0, out=prices)
+        #if stock price is less than 0, it is set to NaN (and stays NaN from then on)
+        negative = np.logical_or.accumulate(prices[1:] < 0, axis=0)
+        prices[1:][negative] = np.nan
+        stock_prices[p] = prices
+    return stock_prices
+
+def generate_stock_price(days, initial_price, volatility, seed=None, dtype=np.float64):
     '''
     Generates share prices for a given number of companies,
     with a given inital price and volatility after a given
     number of days.
 
     Input:
-        days (ndarray): the stock price data
-        period (int, default 7): how often we buy/sell (days)
-        amount (float, default 5000): how much we spend on each purchase
-            (must cover fees)
-        fees (float, default 20): transaction fees
+        days (int): number of days to generate
+        initial_price (list): initial price for each stock
+        volatility (list): volatility for each stock
+        seed (int, default None): seed for the random generator, for repeatable data
+        dtype (default np.float64): dtype of the returned prices, e.g. np.float32
 
     Output: stock_prices (ndarray): the generated stock price data
     '''
 
-    #number of companies
-    n = len(initial_price)
-    #creating an array to store the stock_prices
-    stock_prices = np.zeros([days,n])
-    #first row is initial price
-    stock_prices[0] = initial_price
-    #using numpy to set up a random generator
-    rng = np.random.default_rng()
-    #drift array to store total drift, allows for max duration (14 days) to avoid errors
-    drift = np.zeros([days + 14,n])
-    #looping over each day
-    for i in range(1,days):
-        #probabilty of news each day 1%
-        news_today = rng.choice([True, False], p = [0.01, 0.99])
-        #randomly generated the event to last between 3 to 14 days, if it happens
-        if news_today:
-            duration = rng.integers(3, 14)
-        #looping over each company
-        for j in range(n):
-            sd = volatility[j]**2
-            #increment with normal distrubtuion(0,volatility^2)
-            inc = rng.normal(0, sd)
-            if news_today == True:
-                #m with normal distrubution(0,4)
-                m = rng.normal(0, 4)
-                #looping over all the days the event happens
-                for k in range(i, i + duration):
-                    #add drift to any previous drift
-                    drift[k][j] += m * volatility[j]
-            #calucating the stock price for each stock on that day, with increment and drift added.
-            stock_prices[i][j] = stock_prices[i-1][j] + inc + drift[i][j]
-            #if stock price is less than 0, it is set to NaN
-            if stock_prices[i][j] < 0:
-                stock_prices[i][j] = np.nan
-    return stock_prices
+    return generate_stock_paths(days, initial_price, volatility, 1, seed, dtype)[0]
+
+def _cache_paths(data_file, dtype=np.float64):
+    '''
+    Returns the paths of the binary price cache and its metadata index for data_file,
+    e.g. stock_data_5y_cache.npy and stock_data_5y_cache_index.npz. Each dtype other
+    than float64 has its own cache (stock_data_5y_float32_cache.npy, ...).
+    '''
+    root = os.path.splitext(data_file)[0]
+    dtype = np.dtype(dtype)
+    if dtype != np.float64:
+        root += '_' + dtype.name
+    return root + '_cache.npy', root + '_cache_index.npz'
+
+def _save_replace(path, save, *args, **kwargs):
+    '''
+    Writes path with save(file, *args, **kwargs) (e.g. np.save) into a temporary file in
+    the same folder, then moves it into place with os.replace(). Readers see either the
+    old file or the complete new one, and processes that memory-mapped the old file keep
+    reading it.
+    '''
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            save(f, *args, **kwargs)
+        #mkstemp() creates the file readable by its owner only
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def build_cache(data_file='stock_data_5y.txt', dtype=np.float64):
+    '''
+    Reads data_file once with loadtxt() and writes a binary, memory-mappable copy of
+    the price rows, plus a metadata index holding the volatility and initial price of
+    each column (and their sort orders for nearest-match lookups).
+    Both files are replaced atomically, the prices first and the index last, so other
+    processes can use the cache while it is rebuilt: the index of a half-built cache is
+    still the old one, whose mtime does not match data_file.
+
+    Input:
+        data_file (str, default 'stock_data_5y.txt'): path to the text data file,
+            first row is the volatility, the following rows are the daily prices.
+        dtype (default np.float64): dtype the prices are stored as (e.g. np.float32)
 
-def get_data(method='read', initial_price=None, volatility=None):
+    Output: None
+    '''
+    data_path, index_path = _cache_paths(data_file, dtype)
+    mtime = os.path.getmtime(data_file)
+    file_array = np.loadtxt(data_file, ndmin=2)
+    #price rows only, volatility (first row) is stored in the index
+    _save_replace(data_path, np.save, file_array[1:].astype(dtype, copy=False))
+    volatility = file_array[0]
+    initial_price = file_array[1]
+    _save_replace(index_path, np.savez, mtime=mtime,
+                  volatility=volatility, volatility_order=np.argsort(volatility, kind='stable'),
+                  initial_price=initial_price, initial_price_order=np.argsort(initial_price, kind='stable'))
+
+def load_cache(data_file='stock_data_5y.txt', dtype=np.float64):
+    '''
+    Loads the binary cache of data_file, building it first if it is missing or if
+    data_file has been modified since the cache was built.
+
+    Input:
+        data_file (str, default 'stock_data_5y.txt'): path to the text data file
+        dtype (default np.float64): dtype of the cached prices (e.g. np.float32)
+
+    Output:
+        prices (ndarray): memory-mapped (copy-on-write) price data, one column per stock
+        index (dict): 'volatility' and 'initial_price' of each column, with their
+            sort orders 'volatility_order' and 'initial_price_order'
+    '''
+    data_path, index_path = _cache_paths(data_file, dtype)
+    index = None
+    if os.path.exists(data_path) and os.path.exists(index_path):
+        with np.load(index_path) as f:
+            index = dict(f)
+        if index['mtime'] != os.path.getmtime(data_file):
+            index = None
+    if index is None:
+        build_cache(data_file, dtype)
+        with np.load(index_path) as f:
+            index = dict(f)
+    prices = np.load(data_path, mmap_mode='c')
+    return prices, index
+
+def nearest_columns(values, order, targets):
+    '''
+    Finds, for each target, the column whose value is closest to it, using the sorted
+    order of the values. Ties go to the lowest column, like argmin().
+
+    Input:
+        values (ndarray): value of each column (e.g. the volatilities)
+        order (ndarray): indices that sort values (stable)
+        targets (list): the values to match
+
+    Output: columns (ndarray): the index of the closest column for each target
+    '''
+    sorted_values = values[order]
+    targets = np.asarray(targets, dtype=float)
+    #first sorted value >= target, and first of the run of equal values just below it
+    pos = np.searchsorted(sorted_values, targets)
+    right = order[np.minimum(pos, len(values) - 1)]
+    left = order[np.searchsorted(sorted_values, sorted_values[np.maximum(pos - 1, 0)])]
+    d_left = np.abs(values[left] - targets)
+    d_right = np.abs(values[right] - targets)
+    use_left = (d_left < d_right) | ((d_left == d_right) & (left < right))
+    return np.where(use_left, left, right)
+
+def _select_columns(prices, columns):
+    '''
+    Returns the given columns of prices, as a view if they are a contiguous ascending block.
+    '''
+    if len(columns) > 0 and np.array_equal(columns, np.arange(columns[0], columns[0] + len(columns))):
+        return prices[:, columns[0]:columns[0] + len(columns)]
+    return np.asarray(prices[:, columns])
+
+def get_data(method='read', initial_price=None, volatility=None, data_file='stock_data_5y.txt', dtype=np.float64):
     '''
     Generates or reads simulation data for one or more stocks over 5 years,
     given their initial share price and volatility.
@@ -61,8 +200,8 @@ def get_data(method='read', initial_price=None, volatility=None):
         method (str): either 'generate' or 'read' (default 'read').
             If method is 'generate', use generate_stock_price() to generate
                 the data from scratch.
-            If method is 'read', use Numpy's loadtxt() to read the data
-                from the file stock_data_5y.txt.
+            If method is 'read', read the data from the file stock_data_5y.txt,
+                through its binary cache (see load_cache()).
 
         initial_price (list): list of initial prices for each stock (default None)
             If method is 'generate', use these initial prices to generate the data.
@@ -74,6 +213,11 @@ def get_data(method='read', initial_price=None, volatility=None):
             If method is 'read', choose the column in stock_data_5y.txt with the closest
                 volatility to each value in the list, and display an appropriate message.
 
+        data_file (str, default 'stock_data_5y.txt'): path to the data file to read.
+
+        dtype (default np.float64): dtype of the returned prices, e.g. np.float32 to halve
+            their memory (the 'read' cache is then stored as float32 too).
+
         If no arguments are specified, read price data from the whole file.
 
     Output:
@@ -82,71 +226,42 @@ def get_data(method='read', initial_price=None, volatility=None):
     '''
 
     if method == 'read':
-        if initial_price == None:
-            if volatility == None:
-                sim_data = np.loadtxt('stock_data_5y.txt')
-                #delete volatility (first row) from array
-                sim_data = np.delete(sim_data,0,0)
+        prices, index = load_cache(data_file, dtype)
+        if initial_price is None:
+            if volatility is None:
                 print('Whole file data has been returned.')
                 print('Please specify an initial_price if you wish for something more specific.')
-                return sim_data
+                return prices
             else:
-                #number of stocks needed
-                n = len(volatility)
-                file_array = np.loadtxt('stock_data_5y.txt')
-                m = len(file_array)
-                #creating a array based on the length of the volatility and given file
-                sim_data = np.zeros((m,n))
-                for i in range(n):
-                    #getting the index of the array, which is the closest match to the volatility's given
-                    index = (np.abs(file_array[0] - volatility[i])).argmin()
-                    sim_data[:,i] = file_array[:,index]
-                print(f'Found data with initial prices: {sim_data[1]} and volatilities: {sim_data[0]}')
-                #delete volatility (first row) from array
-                sim_data = np.delete(sim_data, 0, 0)
+                #getting the indices of the columns, which are the closest match to the volatility's given
+                columns = nearest_columns(index['volatility'], index['volatility_order'], volatility)
+                sim_data = _select_columns(prices, columns)
+                print(f'Found data with initial prices: {index["initial_price"][columns]} and volatilities: {index["volatility"][columns]}')
                 return sim_data
         else:
-            if volatility == None:
-                n = len(initial_price)
-                file_array = np.loadtxt('stock_data_5y.txt')
-                m = len(file_array)
-                sim_data = np.zeros((m,n))
-                for i in range(n):
-                    #getting the index of the array, which is the closest match to the inital price's given
-                    index = (np.abs(file_array[1] - initial_price[i])).argmin()
-                    sim_data[:,i] = file_array[:,index]
-                print(f'Found data with initial prices: {sim_data[1]} and volatilities: {sim_data[0]}')
-                #delete volatility (first row) from array
-                sim_data = np.delete(sim_data, 0, 0)
-                return sim_data
+            #getting the indices of the columns, which are the closest match to the inital price's given
+            columns = nearest_columns(index['initial_price'], index['initial_price_order'], initial_price)
+            sim_data = _select_columns(prices, columns)
+            if volatility is None:
+                print(f'Found data with initial prices: {index["initial_price"][columns]} and volatilities: {index["volatility"][columns]}')
             else:
-                n = len(initial_price)
-                file_array = np.loadtxt('stock_data_5y.txt')
-                m = len(file_array)
-                sim_data = np.zeros((m,n))
-                for i in range(n):
-                    #getting the index of the array, which is the closest match to the inital price's given
-                    index = (np.abs(file_array[1] - initial_price[i])).argmin()
-                    sim_data[:,i] = file_array[:,index]
-                print(f'Found data with initial prices: {sim_data[1]} and volatilities: {sim_data[0]}.')
+                print(f'Found data with initial prices: {index["initial_price"][columns]} and volatilities: {index["volatility"][columns]}.')
                 print('Input argument volatility ignored.')
-                #delete volatility (first row) from array
-                sim_data = np.delete(sim_data, 0, 0)
-                return sim_data
+            return sim_data
     if method == 'generate':
-        if initial_price == None:
-            if volatility == None:
+        if initial_price is None:
+            if volatility is None:
                 print('Please specify the inital price and the volatility.')
                 return None
             else:
                 print('Please specify the initial price.')
                 return None
         else:
-            if volatility == None:
+            if volatility is None:
                 print('Please specify the volatility.')
                 return None
             else:
-                sim_data = generate_stock_price(1825, initial_price, volatility) #1825 is 5 years in days
+                sim_data = generate_stock_price(1825, initial_price, volatility, dtype=dtype) #1825 is 5 years in days
                 print(f'Data has been generated using initial prices: {initial_price} and volatilities: {volatility}')
                 return sim_data
     if method != 'generate' and method != 'read':
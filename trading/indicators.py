@@ -1,6 +1,95 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
-def moving_average(stock_price, n=7, weights=[]):
+def _as_prices(stock_prices, dtype):
+    '''
+    Returns stock_prices as an array of dtype, or of its own dtype if dtype is None
+    (float64 if it is not a floating point array).
+    '''
+    stock_prices = np.asarray(stock_prices)
+    if dtype is None:
+        dtype = stock_prices.dtype if np.issubdtype(stock_prices.dtype, np.floating) else np.float64
+    return stock_prices.astype(dtype, copy=False)
+
+def _rolling_sum(values, n, chunk=256):
+    '''
+    Sums every n-day window of values (along the first axis), accumulated in float64
+    whatever the dtype of values. Each window is summed on its own, as np.average() of
+    the window does, so equal windows give exactly equal sums (a difference of cumulative
+    sums is off by rounding errors). The columns are summed chunk at a time, from a
+    contiguous copy of each chunk with one row per column.
+    Window k covers days k to k+n-1, any NaN in a window makes its sum NaN.
+    '''
+    days = len(values)
+    columns = values.reshape(days, -1)
+    sums = np.empty((columns.shape[1], days - n + 1))
+    for j in range(0, columns.shape[1], chunk):
+        block = np.ascontiguousarray(columns[:, j:j + chunk].T)
+        np.sum(sliding_window_view(block, n, axis=1), axis=-1, dtype=np.float64, out=sums[j:j + chunk])
+    return sums.T.reshape((days - n + 1,) + values.shape[1:])
+
+def _rolling_extreme(values, n, func):
+    '''
+    Maximum (func=np.maximum) or minimum (func=np.minimum) of every n-day window of values
+    (along the first axis), in O(days) with block prefix and suffix accumulations.
+    Window k covers days k to k+n-1, any NaN in a window makes its result NaN.
+    '''
+    days = len(values)
+    blocks = -(-days // n)
+    fill = -np.inf if func is np.maximum else np.inf
+    padded = np.full((blocks * n,) + values.shape[1:], fill, dtype=values.dtype)
+    padded[:days] = values
+    by_block = padded.reshape((blocks, n) + values.shape[1:])
+    prefix = func.accumulate(by_block, axis=1).reshape(padded.shape)
+    suffix = func.accumulate(by_block[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    #a window spans at most two blocks: the end of the first and the start of the second
+    return func(suffix[:days - n + 1], prefix[n - 1:days])
+
+
+def moving_averages(stock_prices, n=7, weights=[], ma_type='simple', dtype=None):
+    '''
+    Calculates the n-day moving average for every stock at once.
+
+    Input:
+        stock_prices (ndarray): the stock price data, one column per stock (a single
+            column is also accepted).
+        n (int, default 7): period of the moving average (in days).
+        weights (list, default []): must be of length n if specified. Indicates the weights
+            to use for the weighted average. If empty, return a non-weighted average.
+        ma_type (str, default 'simple'): either 'simple' or 'exponential'. The exponential
+            moving average starts from the simple average of the first n days and has a
+            smoothing factor of 2 / (n + 1), weights are ignored.
+        dtype (default None): dtype of the prices and of the result, e.g. np.float32.
+            If None, the dtype of stock_prices (float64 if it is not floating point).
+            Window sums are accumulated in float64.
+    Output:
+        ma (ndarray): the n-day moving average of the share prices over time, same shape
+            as stock_prices. As in moving_average(), the average on day i uses the n days
+            before it and the first n days are NaN.
+    '''
+    stock_prices = _as_prices(stock_prices, dtype)
+    days = len(stock_prices)
+    ma = np.full(stock_prices.shape, np.nan, dtype=stock_prices.dtype)
+    #not enough days for a single average
+    if days <= n:
+        return ma
+    if ma_type == 'exponential':
+        alpha = 2 / (n + 1)
+        ma[n] = np.mean(stock_prices[:n], axis=0)
+        for i in range(n + 1, days):
+            ma[i] = alpha * stock_prices[i-1] + (1 - alpha) * ma[i-1]
+    elif len(weights) > 0:
+        #weighted average as a convolution with the weights, one shifted pass per weight
+        total = np.zeros(ma[n:].shape)
+        for j in range(n):
+            total += weights[j] * stock_prices[j:days-n+j]
+        ma[n:] = total / n
+    else:
+        #window sums from the cumulative sum
+        ma[n:] = _rolling_sum(stock_prices[:-1], n) / n
+    return ma
+
+def moving_average(stock_price, n=7, weights=[], dtype=None):
     '''
     Calculates the n-day (possibly weighted) moving average for a given stock over time.
 
@@ -10,88 +99,91 @@ def moving_average(stock_price, n=7, weights=[]):
         n (int, default 7): period of the moving average (in days).
         weights (list, default []): must be of length n if specified. Indicates the weights
             to use for the weighted average. If empty, return a non-weighted average.
+        dtype (default None): dtype of the result, e.g. np.float32 (see moving_averages()).
     Output:
         ma (ndarray): the n-day (possibly weighted) moving average of the share price over time.
     Note:
-        If n is greater than the stock_price size, then the function will fail.
+        If n is greater than the stock_price size, then the moving average is all NaN.
     '''
+    return moving_averages(stock_price, n, weights, dtype=dtype)
 
 
-    ma = np.zeros(len(stock_price))
-    #from day 0 to n, there are no previous days, so the moving average is marked as NaN
-    for i in range(n):
-        ma[i] = np.nan
-    for i in range(n,len(stock_price)):
-        #getting the section of the stock price based on the period n
-        ma_ls = stock_price[i-n:i]
-        #calculating the weighted average, if applicable
-        if len(weights) > 0:
-            ma_w = []
-            for j in range(0,n):
-                ma_w.append(ma_ls[j] * weights[j])
-            ma[i] = np.average(ma_w)
-        else:
-            ma[i] = np.average(ma_ls)
-    return ma
-
-
-def oscillator(stock_price, n=7, osc_type='stochastic'):
+def oscillators(stock_prices, n=7, osc_type='stochastic', smoothing='simple', dtype=None):
     '''
-    Calculates the level of the stochastic or RSI oscillator with a period of n days.
+    Calculates the level of the stochastic or RSI oscillator with a period of n days
+    for every stock at once.
 
     Input:
-        stock_price (ndarray): single column with the share prices over time for one stock,
-            up to the current day.
-        n (int, default 7): period of the moving average (in days).
+        stock_prices (ndarray): the stock price data, one column per stock (a single
+            column is also accepted).
+        n (int, default 7): period of the oscillator (in days).
         osc_type (str, default 'stochastic'): either 'stochastic' or 'RSI' to choose an oscillator.
+        smoothing (str, default 'simple'): RSI only, either 'simple' (average gains and losses
+            over the last n days, as in oscillator()) or 'wilder' (Wilder smoothing, starting
+            from the simple averages on day n-1, an RSI of 1 when there are no losses).
+        dtype (default None): dtype of the prices and of the result, e.g. np.float32.
+            If None, the dtype of stock_prices (float64 if it is not floating point).
 
     Output:
-        osc (ndarray): the oscillator level with period $n$ for the stock over time.
+        osc (ndarray): the oscillator level with period $n$ for every stock over time,
+            same shape as stock_prices. The first n-1 days are NaN.
     '''
-    osc = np.zeros(len(stock_price))
-    for i in range(n):
-        osc[i] = np.nan
+    stock_prices = _as_prices(stock_prices, dtype)
+    days = len(stock_prices)
+    osc = np.full(stock_prices.shape, np.nan, dtype=stock_prices.dtype)
+    if days < n:
+        return osc
 
     if osc_type == 'stochastic':
-        for i in range(n-1,len(stock_price)):
-            #getting the section of the stock price based on the period n
-            #i-n-1 and i-1 to represent the past 7 days, not including today.
-            sto_osc = stock_price[i+1-n:i+1]
-            highest = max(sto_osc)
-            lowest = min(sto_osc)
-            delta = stock_price[i] - lowest
-            delta_max = highest - lowest
-            osc[i] = delta / delta_max
+        #highest and lowest prices of the past n days, including today
+        highest = _rolling_extreme(stock_prices, n, np.maximum)
+        lowest = _rolling_extreme(stock_prices, n, np.minimum)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            osc[n-1:] = (stock_prices[n-1:] - lowest) / (highest - lowest)
         return osc
 
     if osc_type == 'RSI':
-
-        for i in range(n-1, len(stock_price)):
-            negative = []
-            positive = []
-            #getting the section of the stock price based on the period n
-            #i-n-1 and i-1 to represent the past 7 days, including today.
-            rsi_osc = stock_price[i+1-n:i+1]
-            #calucating the difference between consecutive days
-            diff = [rsi_osc[j+1] - rsi_osc[j] for j in range(len(rsi_osc)-1)]
-            #assigning the differences to positve or negative lists
-            for k in range(len(diff)):
-                if diff[k] < 0:
-                    negative.append(diff[k])
-                else:
-                    positive.append(diff[k])
+        #difference between consecutive days, split into gains and losses
+        diff = np.diff(stock_prices, axis=0)
+        loss = diff < 0
+        gains = np.where(loss, 0, diff)
+        losses = np.where(loss, diff, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if smoothing == 'wilder':
+                period = n - 1
+                pos_avg = np.full(gains.shape, np.nan)
+                neg_avg = np.full(losses.shape, np.nan)
+                pos_avg[period-1] = np.mean(gains[:period], axis=0)
+                neg_avg[period-1] = -np.mean(losses[:period], axis=0)
+                for i in range(period, len(diff)):
+                    pos_avg[i] = (pos_avg[i-1] * (period - 1) + gains[i]) / period
+                    neg_avg[i] = (neg_avg[i-1] * (period - 1) - losses[i]) / period
+                rs = pos_avg[period-1:] / neg_avg[period-1:]
+                osc[n-1:] = np.where(neg_avg[period-1:] == 0, 1, 1 - (1 / (1 + rs)))
+                return osc
+            #averages of the gains and losses over the n-1 differences of the past n days
+            neg_count = _rolling_sum(loss.astype(float), n - 1)
+            pos_count = (n - 1) - neg_count
+            pos_avg = _rolling_sum(gains, n - 1) / pos_count
+            neg_avg = np.abs(_rolling_sum(losses, n - 1) / neg_count)
             #different RS forumlas, dependent on whether there are any negative or postive values
-            #Checks to see if there are any postive or negative values
-            if len(negative) == 0:
-                pos_avg = np.average(positive)
-                rs = pos_avg
-            elif len(positive) == 0:
-                neg_avg = abs(np.average(negative))
-                rs = neg_avg
-            else:
-                pos_avg = np.average(positive)
-                neg_avg = abs(np.average(negative))
-                rs = pos_avg / neg_avg
+            rs = np.where(neg_count == 0, pos_avg, np.where(pos_count == 0, neg_avg, pos_avg / neg_avg))
             #RS formula
-            osc[i] = 1 - (1 / (1 + rs))
+            osc[n-1:] = 1 - (1 / (1 + rs))
         return osc
+
+def oscillator(stock_price, n=7, osc_type='stochastic', dtype=None):
+    '''
+    Calculates the level of the stochastic or RSI oscillator with a period of n days.
+
+    Input:
+        stock_price (ndarray): single column with the share prices over time for one stock,
+            up to the current day.
+        n (int, default 7): period of the moving average (in days).
+        osc_type (str, default 'stochastic'): either 'stochastic' or 'RSI' to choose an oscillator.
+        dtype (default None): dtype of the result, e.g. np.float32 (see oscillators()).
+
+    Output:
+        osc (ndarray): the oscillator level with period $n$ for the stock over time.
+    '''
+    return oscillators(stock_price, n, osc_type, dtype=dtype)
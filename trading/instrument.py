@@ -0,0 +1,140 @@
+# Opt-in instrumentation: wall time per stage and counters, off by default.
+import atexit
+import functools
+import json
+import os
+import time
+from collections import defaultdict
+
+#checked before anything is recorded, set with enable() and disable()
+enabled = False
+
+_seconds = defaultdict(float)
+_calls = defaultdict(int)
+_counters = defaultdict(int)
+_dump_registered = False
+
+
+class _NullStage:
+    '''
+    Stage used while instrumentation is disabled, does nothing.
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    '''
+    Adds the wall time spent inside the with block to the stage name.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        _seconds[self.name] += time.perf_counter() - self.start
+        _calls[self.name] += 1
+        return False
+
+
+def stage(name):
+    '''
+    Context manager timing a stage of a run, e.g. with instrument.stage('momentum.indicators'):
+    Does nothing while instrumentation is disabled.
+    '''
+    if not enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+def timed(name):
+    '''
+    Decorator timing every call of a function as the stage name.
+    While instrumentation is disabled the function is called directly.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, value=1):
+    '''
+    Adds value to the counter name. In hot paths, check instrument.enabled before calling.
+    '''
+    if enabled:
+        _counters[name] += int(value)
+
+def enable(report_file=None):
+    '''
+    Turns instrumentation on.
+
+    Input:
+        report_file (str, default None): if specified, dump the report to this file
+            (as JSON, or printed if '-') when the program exits.
+    '''
+    global enabled, _dump_registered
+    enabled = True
+    if report_file is not None and not _dump_registered:
+        atexit.register(dump, None if report_file == '-' else report_file)
+        _dump_registered = True
+
+def disable():
+    '''
+    Turns instrumentation off (the recorded values are kept, see reset()).
+    '''
+    global enabled
+    enabled = False
+
+def reset():
+    '''
+    Clears all recorded stage times and counters.
+    '''
+    _seconds.clear()
+    _calls.clear()
+    _counters.clear()
+
+def report():
+    '''
+    Returns the recorded values.
+
+    Output: report (dict):
+        'stages': {stage name: {'seconds': total wall time, 'calls': number of calls}}
+        'counters': {counter name: value}
+    '''
+    return {'stages': {name: {'seconds': _seconds[name], 'calls': _calls[name]} for name in sorted(_seconds)},
+            'counters': dict(sorted(_counters.items()))}
+
+def dump(report_file=None):
+    '''
+    Writes the report to report_file as JSON, or prints it if report_file is None.
+    '''
+    values = report()
+    if report_file is not None:
+        with open(report_file, 'w') as f:
+            json.dump(values, f, indent=2)
+        return None
+    print('Stages:')
+    for name, stage_values in values['stages'].items():
+        print(f'    {name}: {stage_values["seconds"]:.4f}s over {stage_values["calls"]} calls')
+    print('Counters:')
+    for name, value in values['counters'].items():
+        print(f'    {name}: {value}')
+    return None
+
+#TRADING_INSTRUMENT=<report file> (or '-' to print) turns instrumentation on for a whole run
+if os.environ.get('TRADING_INSTRUMENT'):
+    enable(os.environ['TRADING_INSTRUMENT'])
@@ -0,0 +1,90 @@
+# Monte Carlo backtests: run the strategies over many generated price paths.
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from trading import data
+from trading import strategy as strat
+from trading import process as proc
+from trading import performance as perf
+from trading.cache import indicator_cache
+
+#default strategies to compare, label: (strategy name in trading.strategy, arguments)
+DEFAULT_STRATEGIES = {'random': ('random', {}),
+                      'crossing_averages': ('crossing_averages', {}),
+                      'momentum': ('momentum', {})}
+
+#quantiles reported for each outcome
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+def _run_batch(task):
+    '''
+    Generates each path of a batch in turn and runs every strategy on it, in a worker process.
+    Only the profit, number of transactions and maximum drawdown of each run are returned.
+    '''
+    seeds, days, initial_price, volatility, strategies = task
+    #every path has new prices, so cached indicators would never be reused: skip the cache
+    indicator_cache.set_memory_budget(0)
+    results = []
+    for seed in seeds:
+        stock_prices = data.generate_stock_price(days, initial_price, volatility, seed)
+        #the random strategy uses numpy's global generator, seed it from the path too
+        np.random.seed(seed.generate_state(1)[0])
+        outcome = {}
+        for label, (name, config) in strategies.items():
+            ledger = proc.LedgerWriter(None)
+            getattr(strat, name)(stock_prices, ledger=ledger, **config)
+            transactions = ledger.transactions()
+            summary = perf.transactions_summary(transactions)
+            drawdown = perf.max_drawdown(perf.equity_curve(transactions, stock_prices))
+            outcome[label] = (summary['profit'], summary['transactions'], drawdown)
+        results.append(outcome)
+    return results
+
+def _distribution(values):
+    '''
+    Summarizes the outcomes of all paths: mean, standard deviation and quantiles.
+    '''
+    return {'mean': float(np.mean(values)),
+            'std': float(np.std(values)),
+            'quantiles': dict(zip(QUANTILES, np.quantile(values, QUANTILES).tolist()))}
+
+def run_monte_carlo(initial_price, volatility, strategies=DEFAULT_STRATEGIES, paths=100,
+                    days=1825, seed=None, batch_size=10, processes=None):
+    '''
+    Runs strategies on many independent generated price paths, to see how robust they are.
+    Paths are generated inside the workers a batch at a time, so memory only grows with
+    the number of workers, not with the number of paths.
+
+    Input:
+        initial_price (list): initial price for each stock
+        volatility (list): volatility for each stock
+        strategies (dict, default DEFAULT_STRATEGIES): label: (strategy name, arguments)
+            for each strategy to run, e.g. {'rsi': ('momentum', {'osc_type': 'RSI'})}
+        paths (int, default 100): number of price paths
+        days (int, default 1825): number of days in each path
+        seed (int, default None): seed for the paths, each path gets its own seed from it
+        batch_size (int, default 10): number of paths each worker task generates
+        processes (int, default None): number of worker processes (default: number of CPUs)
+
+    Output:
+        results (dict): for each strategy label, the arrays 'profit', 'transactions' and
+            'max_drawdown' (one value per path), and their distributions under
+            'profit_stats', 'transactions_stats' and 'max_drawdown_stats'
+    '''
+    seeds = np.random.SeedSequence(seed).spawn(paths)
+    tasks = [(seeds[i:i + batch_size], days, initial_price, volatility, strategies)
+             for i in range(0, paths, batch_size)]
+    outcomes = {label: [] for label in strategies}
+    with ProcessPoolExecutor(processes) as pool:
+        for batch in pool.map(_run_batch, tasks):
+            for outcome in batch:
+                for label in strategies:
+                    outcomes[label].append(outcome[label])
+    results = {}
+    for label, values in outcomes.items():
+        values = np.array(values, dtype=float).reshape(-1, 3)
+        results[label] = {'profit': values[:, 0],
+                          'transactions': values[:, 1].astype(np.int64),
+                          'max_drawdown': values[:, 2]}
+        for column, key in enumerate(['profit', 'transactions', 'max_drawdown']):
+            results[label][key + '_stats'] = _distribution(values[:, column])
+    return results
@@ -1,40 +1,156 @@
 # Evaluate performance.
-import pandas as pd
 import numpy as np
 
-def read_ledger(ledger_file):
+#columns of the ledger file, and the type to parse each one with
+LEDGER_COLUMNS = ['type','day','stock','num_shares','price','fees','total']
+LEDGER_DTYPES = {'type': 'category', 'day': np.int64, 'stock': np.int64, 'num_shares': np.int64,
+                 'price': np.float64, 'fees': np.float64, 'total': np.float64}
+
+def _extend(values, size):
+    '''
+    Pads the 1D array values with zeros up to length size.
+    '''
+    return np.concatenate([values, np.zeros(size - len(values), dtype=values.dtype)])
+
+def _summarize(chunks):
+    '''
+    Aggregates transactions given as chunks of arrays (is_sell, stock, num_shares, price,
+    fees, total), overall and per stock. See ledger_summary() for the output.
+    '''
+    #totals for buys (index 0) and sells (index 1)
+    totals = np.zeros(2)
+    counts = np.zeros(2, dtype=np.int64)
+    all_fees = 0.0
+    stock_profit = np.zeros(0)
+    stock_trades = np.zeros(0, dtype=np.int64)
+    stock_turnover = np.zeros(0)
+    for is_sell, stock, num_shares, price, fees, total in chunks:
+        is_sell = is_sell.astype(np.int64)
+        totals += np.bincount(is_sell, weights=total, minlength=2)
+        counts += np.bincount(is_sell, minlength=2)
+        all_fees += fees.sum()
+        #per stock sums in one pass each, growing the arrays if new stocks appear
+        size = max(len(stock_profit), stock.max() + 1 if len(stock) > 0 else 0)
+        value = np.abs(num_shares * price)
+        stock_profit = _extend(stock_profit, size) + np.bincount(stock, weights=total, minlength=size)
+        stock_trades = _extend(stock_trades, size) + np.bincount(stock, minlength=size)
+        stock_turnover = _extend(stock_turnover, size) + np.bincount(stock, weights=value, minlength=size)
+    return {'profit': round(float(totals[0] + totals[1]), 2),
+            'transactions': int(counts.sum()),
+            'buys': int(counts[0]),
+            'sells': int(counts[1]),
+            'turnover': float(stock_turnover.sum()),
+            'fees': float(all_fees),
+            'stocks': np.nonzero(stock_trades)[0],
+            'stock_profit': stock_profit,
+            'stock_trades': stock_trades,
+            'stock_turnover': stock_turnover}
+
+def ledger_summary(ledger_file, chunksize=None):
+    '''
+    Aggregates the transactions in ledger_file, overall and per stock.
+
+    Input:
+        ledger_file (str): path to the ledger file
+        chunksize (int, default None): if specified, read the ledger this many lines
+            at a time, so memory does not grow with the size of the file.
+
+    Output: summary (dict):
+        'profit' (float): total profit/loss, rounded to 2 decimals
+        'transactions', 'buys', 'sells' (int): number of transactions of each kind
+        'turnover' (float): total value of the shares traded (excluding fees)
+        'fees' (float): total fees paid
+        'stocks' (ndarray): the stocks that appear in the ledger
+        'stock_profit' (ndarray): profit/loss of each stock, indexed by stock
+        'stock_trades' (ndarray): number of transactions of each stock, indexed by stock
+        'stock_turnover' (ndarray): value of the shares traded for each stock, indexed by stock
+    '''
+    #pandas is slow to import, only load it when a ledger file is actually read
+    import pandas as pd
+    reader = pd.read_csv(ledger_file, names=LEDGER_COLUMNS, dtype=LEDGER_DTYPES, chunksize=chunksize)
+    chunks = [reader] if chunksize is None else reader
+    return _summarize(((chunk['type'] == 'sell').to_numpy(), chunk['stock'].to_numpy(),
+                       chunk['num_shares'].to_numpy(), chunk['price'].to_numpy(),
+                       chunk['fees'].to_numpy(), chunk['total'].to_numpy()) for chunk in chunks)
+
+def transactions_summary(transactions):
+    '''
+    Aggregates transactions kept in memory, as if they had been written to a ledger file
+    and read with ledger_summary() (prices and totals are rounded to 2 decimals).
+
+    Input:
+        transactions (ndarray): structured array of transactions, from
+            process.LedgerWriter(None).transactions()
+
+    Output: summary (dict): see ledger_summary()
+    '''
+    num_shares = transactions['number_of_shares']
+    price = np.round(transactions['price'], 2)
+    total = np.round((-num_shares * transactions['price']) - transactions['fees'], 2)
+    return _summarize([(transactions['type'] == 'sell', transactions['stock'], num_shares,
+                        price, np.round(transactions['fees'], 2), total)])
+
+def equity_curve(transactions, stock_prices):
+    '''
+    Calculates the value of the account each day: cash spent/received so far plus the
+    value of the shares held (shares of a stock with a NaN price are worth nothing).
+
+    Input:
+        transactions (ndarray): structured array of transactions, from
+            process.LedgerWriter(None).transactions()
+        stock_prices (ndarray): the stock price data the transactions were made on
+
+    Output: equity (ndarray): the account value on each day
+    '''
+    days = len(stock_prices)
+    date = transactions['date']
+    sign = np.where(transactions['type'] == 'sell', -1, 1)
+    #shares held of each stock each day
+    shares = np.zeros(np.shape(stock_prices))
+    np.add.at(shares, (date, transactions['stock']), sign * transactions['number_of_shares'])
+    np.cumsum(shares, axis=0, out=shares)
+    total = (-transactions['number_of_shares'] * transactions['price']) - transactions['fees']
+    cash = np.cumsum(np.bincount(date, weights=total, minlength=days))
+    return cash + np.nansum(shares * stock_prices, axis=1)
+
+def max_drawdown(equity):
+    '''
+    Returns the largest fall of equity from a previous peak (0 if it never falls).
+    '''
+    if len(equity) == 0:
+        return 0.0
+    return float(np.max(np.maximum.accumulate(equity) - equity))
+
+def read_ledger(ledger_file, chunksize=None):
     '''
     Reads and reports useful information from ledger_file.
 
     Input:
+        ledger_file (str): path to the ledger file
+        chunksize (int, default None): if specified, read the ledger this many lines
+            at a time (see ledger_summary()).
 
     Output: profit (float): Returns profit for graph building.
     '''
+    summary = ledger_summary(ledger_file, chunksize)
+    print_summary(ledger_file, summary)
+    return summary['profit']
+
+def print_summary(name, summary):
+    '''
+    Prints the results of a run, as reported by read_ledger().
+
+    Input:
+        name (str): name of the run (e.g. the ledger file) the results refer to
+        summary (dict): from ledger_summary() or transactions_summary()
+
+    Output: None
+    '''
     #To show which file the below results refer to
-    print(f'{ledger_file}:')
-    #putting the file into a dataframe
-    header_list = ['type','day','stock','num_shares','price','fees','total']
-    df = pd.read_csv(ledger_file, names=header_list)
-    #total transactions
-    total_t = len(df)
-    #total number of buys and sells
-    total_bs = df['type'].value_counts()
-    total_b = total_bs['buy']
-    #in case there are zero sales
-    try:
-        total_s = total_bs['sell']
-    except:
-        total_s = 0
-    #total amount brought and sold
-    a_buy = df.loc[df['type'] == 'buy', 'total']
-    a_sell = df.loc[df['type'] == 'sell', 'total']
-    #total profit
-    profit = round(sum(a_buy) + sum(a_sell),2)
+    print(f'{name}:')
     #average/worst/best stock
-    if len(df.stock.unique()) > 1:
-        s_t = []
-        for i in range(len(df.stock.unique())):
-            s_t.append(sum(df.loc[df['stock'] == i, 'total']))
+    if len(summary['stocks']) > 1:
+        s_t = summary['stock_profit'][summary['stocks']]
         max_s_t = round(max(s_t),2)
         min_s_t = round(min(s_t),2)
         avg_s_t = round(np.average(s_t),2)
@@ -42,7 +158,5 @@ def read_ledger(ledger_file):
         print(f'The best performing stock made a profit/loss of {max_s_t}')
         print(f'Average stock profit/loss was {avg_s_t}')
 
-    print(f'Total profit: {profit}')
-    print(f'Total transactions: {total_t}, split between {total_b} buys and {total_s} sells\n')
-
-    return profit
+    print(f'Total profit: {summary["profit"]}')
+    print(f'Total transactions: {summary["transactions"]}, split between {summary["buys"]} buys and {summary["sells"]} sells\n')
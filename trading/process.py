@@ -1,6 +1,238 @@
 # Functions to process transactions.
 import numpy as np
 import os
+from trading import instrument
+
+class LedgerWriter:
+    '''
+    Collects transactions in a structured NumPy buffer and appends them to the ledger
+    file in bulk, in the same format as log_transaction(). The buffer starts small and
+    doubles as needed, up to buffer_size transactions.
+    Can be passed anywhere a ledger_file path is expected (buy, sell, create_portfolio).
+
+    Input:
+        ledger_file (str): path to the ledger file. If None, the transactions are
+            kept in memory instead (see transactions()).
+        buffer_size (int, default 65536): number of transactions held before a flush
+
+    Use as a context manager (the buffer is flushed on exit), or call flush() explicitly.
+    '''
+
+    dtype = np.dtype([('type', 'U4'), ('date', 'i8'), ('stock', 'i8'), ('number_of_shares', 'i8'),
+                      ('price', 'f8'), ('fees', 'f8'), ('fees_int', '?')])
+
+    #number of transactions the buffer holds at first
+    initial_size = 256
+
+    def __init__(self, ledger_file, buffer_size=65536):
+        self.ledger_file = ledger_file
+        self.buffer_size = max(buffer_size, 1)
+        self.buffer = np.zeros(min(self.initial_size, self.buffer_size), dtype=self.dtype)
+        self.count = 0
+        #flushed transactions, when kept in memory
+        self.records = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def _make_room(self):
+        '''
+        Doubles the buffer when it is full, or flushes it once it has reached buffer_size.
+        '''
+        if self.count < len(self.buffer):
+            return None
+        if len(self.buffer) < self.buffer_size:
+            buffer = np.zeros(min(2 * len(self.buffer), self.buffer_size), dtype=self.dtype)
+            buffer[:self.count] = self.buffer[:self.count]
+            self.buffer = buffer
+        else:
+            self.flush()
+        return None
+
+    def log(self, transaction_type, date, stock, number_of_shares, price, fees):
+        '''
+        Adds one transaction to the buffer (see log_transaction() for the inputs),
+        making room first if the buffer is full.
+        '''
+        self._make_room()
+        self.buffer[self.count] = (transaction_type, date, stock, number_of_shares, price, fees,
+                                   isinstance(fees, (int, np.integer)))
+        self.count += 1
+
+    def log_many(self, transaction_type, date, stocks, number_of_shares, prices, fees):
+        '''
+        Adds several transactions to the buffer with array assignments
+        (see log_transactions() for the inputs), making room whenever the buffer is full.
+        '''
+        #every input may be a scalar or one value per transaction
+        columns = [(name, np.broadcast_to(values, np.shape(stocks))) for name, values in
+                   (('type', transaction_type), ('date', date), ('stock', stocks),
+                    ('number_of_shares', number_of_shares), ('price', prices), ('fees', fees),
+                    ('fees_int', np.issubdtype(np.asarray(fees).dtype, np.integer)))]
+        start = 0
+        while start < len(stocks):
+            self._make_room()
+            size = min(len(stocks) - start, len(self.buffer) - self.count)
+            rows = self.buffer[self.count:self.count + size]
+            for name, values in columns:
+                rows[name] = values[start:start + size]
+            self.count += size
+            start += size
+
+    def flush(self):
+        '''
+        Appends all buffered transactions to the ledger file with one write, then empties the buffer.
+        '''
+        if self.count == 0:
+            return None
+        rows = self.buffer[:self.count]
+        if self.ledger_file is None:
+            self.records.append(rows.copy())
+            self.count = 0
+            return None
+        total = (-rows['number_of_shares'] * rows['price']) - rows['fees']
+        #fees are written as log_transaction() does, str(round(fees,2)), so integer fees stay
+        #integers (20, not 20.0); each distinct value is formatted once
+        fees = list(zip(rows['fees'].tolist(), rows['fees_int'].tolist()))
+        fees_text = {(f, i): str(round(int(f) if i else f, 2)) for f, i in set(fees)}
+        lines = [f'{t},{d},{s},{n},{p:.2f},{fees_text[f]},{tot:.2f}\n' for t, d, s, n, p, f, tot in
+                 zip(rows['type'].tolist(), rows['date'].tolist(), rows['stock'].tolist(),
+                     rows['number_of_shares'].tolist(), rows['price'].tolist(),
+                     fees, total.tolist())]
+        text = ''.join(lines)
+        #creates file if empty and appends all lines to file
+        with instrument.stage('ledger.write'):
+            with open(self.ledger_file, 'a+') as f:
+                f.write(text)
+        if instrument.enabled:
+            instrument.count('ledger.flushes')
+            instrument.count('ledger.bytes_written', len(text))
+        self.count = 0
+        return None
+
+    def clear(self):
+        '''
+        Drops buffered transactions and removes the ledger file, to start a new ledger.
+        '''
+        self.count = 0
+        self.records = []
+        if self.ledger_file is not None and os.path.exists(self.ledger_file):
+            os.remove(self.ledger_file)
+
+    def transactions(self):
+        '''
+        Returns all transactions kept in memory (ledger_file None) as one structured array.
+        '''
+        self.flush()
+        return np.concatenate(self.records) if self.records else np.zeros(0, dtype=self.dtype)
+
+class Portfolio:
+    '''
+    Portfolio backed by NumPy arrays: the number of shares held of each stock, and the cash
+    spent/received so far (starting from cash). Indexing works like the portfolio list,
+    e.g. portfolio[stock] is the number of shares of stock.
+
+    Input:
+        N (int): number of stocks
+        cash (float, default 0): initial cash
+    '''
+
+    def __init__(self, N, cash=0.0):
+        self.shares = np.zeros(N, dtype=np.int64)
+        self.cash = float(cash)
+
+    def __len__(self):
+        return len(self.shares)
+
+    def __getitem__(self, stock):
+        return self.shares[stock]
+
+    def __setitem__(self, stock, number_of_shares):
+        self.shares[stock] = number_of_shares
+
+    def tolist(self):
+        return self.shares.tolist()
+
+    def value(self, date, stock_prices):
+        '''
+        Returns the cash plus the value of the shares held on date (NaN prices count as 0).
+        '''
+        return self.cash + np.nansum(self.shares * stock_prices[date])
+
+    def buy_many(self, date, stocks, available_capital, stock_prices, fees, ledger_file):
+        '''
+        Buys shares of several stocks on the same date, like calling buy() for each stock
+        in turn: the whole number of shares available_capital (minus fees) pays for.
+
+        Input:
+            date (int): the date of the transactions (nb of days since day 0)
+            stocks (ndarray): the stocks we want to buy
+            available_capital (float or ndarray): the total (maximum) amount to spend
+                on each stock, this must also cover fees
+            stock_prices (ndarray): the stock price data
+            fees (float): total transaction fees (fixed amount per transaction)
+            ledger_file (str or LedgerWriter): path to the ledger file
+
+        Output: None
+        '''
+        stocks = np.asarray(stocks, dtype=np.int64)
+        #trades are always priced in float64, whatever the dtype of the price data
+        prices = np.asarray(stock_prices[date][stocks], dtype=np.float64)
+        if np.isnan(prices).any():
+            raise ValueError('cannot convert float NaN to integer')
+        number_of_shares = ((np.asarray(available_capital) - fees) / prices).astype(np.int64)
+        number_of_shares = np.broadcast_to(number_of_shares, stocks.shape)
+        bought = number_of_shares > 0
+        for _ in range(np.count_nonzero(~bought)):
+            print('You do not have enough capital to buy these shares.')
+        stocks = stocks[bought]
+        number_of_shares = number_of_shares[bought]
+        prices = prices[bought]
+        log_transactions('buy', date, stocks, number_of_shares, prices, fees, ledger_file)
+        np.add.at(self.shares, stocks, number_of_shares)
+        self.cash += np.sum((-number_of_shares * prices) - fees)
+        if instrument.enabled:
+            instrument.count('buy.trades', len(stocks))
+            instrument.count('buy.rejected', np.count_nonzero(~bought))
+
+    def sell_many(self, date, stocks, stock_prices, fees, ledger_file):
+        '''
+        Sells all shares of several stocks on the same date, like calling sell() for each
+        stock in turn.
+
+        Input:
+            date (int): the date of the transactions (nb of days since day 0)
+            stocks (ndarray): the stocks we want to sell
+            stock_prices (ndarray): the stock price data
+            fees (float): transaction fees (fixed amount per transaction)
+            ledger_file (str or LedgerWriter): path to the ledger file
+
+        Output: None
+        '''
+        stocks = np.asarray(stocks, dtype=np.int64)
+        #trades are always priced in float64, whatever the dtype of the price data
+        prices = np.asarray(stock_prices[date][stocks], dtype=np.float64)
+        number_of_shares = self.shares[stocks]
+        #a stock listed more than once is only sold the first time
+        first = np.zeros(len(stocks), dtype=bool)
+        first[np.unique(stocks, return_index=True)[1]] = True
+        number_of_shares = np.where(first, number_of_shares, 0)
+        self.shares[stocks] = 0
+        log_transactions('sell', date, stocks, number_of_shares, -prices, fees, ledger_file)
+        self.cash += np.sum((number_of_shares * prices) - fees)
+        if instrument.enabled:
+            instrument.count('sell.trades', len(stocks))
+
+def as_ledger_writer(ledger):
+    '''
+    Returns ledger if it is already a LedgerWriter, otherwise a new LedgerWriter for the path ledger.
+    '''
+    if isinstance(ledger, LedgerWriter):
+        return ledger
+    return LedgerWriter(ledger)
 
 def log_transaction(transaction_type, date, stock, number_of_shares, price, fees, ledger_file):
     '''
@@ -13,20 +245,56 @@ def log_transaction(transaction_type, date, stock, number_of_shares, price, fees
         number_of_shares (int): the number of shares bought or sold
         price (float): the price of a share at the time of the transaction
         fees (float): transaction fees (fixed amount per transaction, independent of the number of shares)
-        ledger_file (str): path to the ledger file
+        ledger_file (str or LedgerWriter): path to the ledger file, or a LedgerWriter
+            to buffer the transaction in
 
     Output: None.
         Writes one line in the ledger file to record a transaction with the input information.
 
     '''
-    #creates file if empty and appends string to file
-    f = open(ledger_file, 'a+')
-    string = str(transaction_type) + ',' + str(date) + ',' + str(stock) + ',' + str(number_of_shares)\
-            + ',' + format(price, '.2f') + ',' + str(round(fees,2)) + ',' +\
-            str(format((-number_of_shares * price) - fees, '.2f'))
-    f.write(string)
-    f.write('\n')
-    f.close()
+    if isinstance(ledger_file, LedgerWriter):
+        ledger_file.log(transaction_type, date, stock, number_of_shares, price, fees)
+        if instrument.enabled:
+            instrument.count('ledger.transactions')
+        return None
+    with instrument.stage('ledger.write'):
+        #creates file if empty and appends string to file
+        f = open(ledger_file, 'a+')
+        string = str(transaction_type) + ',' + str(date) + ',' + str(stock) + ',' + str(number_of_shares)\
+                + ',' + format(price, '.2f') + ',' + str(round(fees,2)) + ',' +\
+                str(format((-number_of_shares * price) - fees, '.2f'))
+        f.write(string)
+        f.write('\n')
+        f.close()
+    if instrument.enabled:
+        instrument.count('ledger.transactions')
+        instrument.count('ledger.bytes_written', len(string) + 1)
+    return None
+
+def log_transactions(transaction_type, date, stocks, number_of_shares, prices, fees, ledger_file):
+    '''
+    Records several transactions in the file, ledger_file, in one step.
+    The lines written are the same as calling log_transaction() for each of them.
+
+    Input:
+        transaction_type (str or ndarray): 'buy' or 'sell', for all transactions or for each one
+        date (int or ndarray): the date of the transactions (nb of days since day 0)
+        stocks (ndarray): the stocks we buy or sell
+        number_of_shares (ndarray): the number of shares bought or sold of each stock
+        prices (ndarray): the price of a share of each stock at the time of the transaction
+        fees (float): transaction fees (fixed amount per transaction)
+        ledger_file (str or LedgerWriter): path to the ledger file, or a LedgerWriter
+            to buffer the transactions in
+
+    Output: None
+    '''
+    if isinstance(ledger_file, LedgerWriter):
+        ledger_file.log_many(transaction_type, date, stocks, number_of_shares, prices, fees)
+    else:
+        with LedgerWriter(ledger_file, max(len(stocks), 1)) as writer:
+            writer.log_many(transaction_type, date, stocks, number_of_shares, prices, fees)
+    if instrument.enabled:
+        instrument.count('ledger.transactions', len(stocks))
     return None
 
 def buy(date, stock, available_capital, stock_prices, fees, portfolio, ledger_file):
@@ -41,18 +309,24 @@ def buy(date, stock, available_capital, stock_prices, fees, portfolio, ledger_fi
             this must also cover fees
         stock_prices (ndarray): the stock price data
         fees (float): total transaction fees (fixed amount per transaction)
-        portfolio (list): our current portfolio
-        ledger_file (str): path to the ledger file
+        portfolio (list or Portfolio): our current portfolio
+        ledger_file (str or LedgerWriter): path to the ledger file
 
     Output: None
     '''
-    price = stock_prices[date][stock]
+    price = np.float64(stock_prices[date][stock])
     number_of_shares = int((available_capital - fees) / price)
     if number_of_shares > 0:
         log_transaction('buy', date, stock, number_of_shares, price, fees, ledger_file)
         portfolio[stock] += number_of_shares
+        if isinstance(portfolio, Portfolio):
+            portfolio.cash += (-number_of_shares * price) - fees
+        if instrument.enabled:
+            instrument.count('buy.trades')
     else:
         print('You do not have enough capital to buy these shares.')
+        if instrument.enabled:
+            instrument.count('buy.rejected')
 
 def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
     '''
@@ -64,16 +338,21 @@ def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
         stock (int): the stock we want to sell
         stock_prices (ndarray): the stock price data
         fees (float): transaction fees (fixed amount per transaction)
-        portfolio (list): our current portfolio
-        ledger_file (str): path to the ledger file
+        portfolio (list or Portfolio): our current portfolio
+        ledger_file (str or LedgerWriter): path to the ledger file
 
     Output: None
     '''
-    price = stock_prices[date][stock]
+    price = np.float64(stock_prices[date][stock])
     number_of_shares = portfolio[stock]
     portfolio[stock] = 0
     log_transaction('sell', date, stock, number_of_shares, -price, fees, ledger_file)
+    if isinstance(portfolio, Portfolio):
+        portfolio.cash += (number_of_shares * price) - fees
+    if instrument.enabled:
+        instrument.count('sell.trades')
 
+@instrument.timed('create_portfolio')
 def create_portfolio(available_amounts, stock_prices, fees, ledger_file):
     '''
     Creates a portfolio by buying a given number of shares of each stock.
@@ -83,14 +362,16 @@ def create_portfolio(available_amounts, stock_prices, fees, ledger_file):
             purchase for each stock (this should cover fees)
         stock_prices (ndarray): the stock price data
         fees (float): transaction fees (fixed amount per transaction)
+        ledger_file (str or LedgerWriter): path to the ledger file
 
     Output:
-        portfolio (list): the initial portfolio
+        portfolio (Portfolio): the initial portfolio
     '''
     #removes old file so new data doesn't get added to old file
-    if os.path.exists(ledger_file):
+    if isinstance(ledger_file, LedgerWriter):
+        ledger_file.clear()
+    elif os.path.exists(ledger_file):
         os.remove(ledger_file)
-    portfolio = [0] * len(stock_prices[0])
-    for i in range(len(stock_prices[0])):
-        buy(0, i, available_amounts[i], stock_prices, fees, portfolio, ledger_file)
+    portfolio = Portfolio(len(stock_prices[0]))
+    portfolio.buy_many(0, np.arange(len(stock_prices[0])), available_amounts, stock_prices, fees, ledger_file)
     return portfolio
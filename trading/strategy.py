@@ -1,8 +1,26 @@
 # Functions to implement our trading strategy.
 import numpy as np
 from trading import process as proc
-from trading import indicators as ind
+from trading import instrument
+from trading.cache import indicator_cache
 
+def _blocks(N, block_size):
+    '''
+    Returns (start, stop) for each block of block_size stocks, or a single block of all
+    N stocks if block_size is None.
+    '''
+    step = max(N if block_size is None else block_size, 1)
+    return [(start, min(start + step, N)) for start in range(0, N, step)]
+
+def _sell_all(stock_prices, fees, portfolio, ledger):
+    '''
+    Sells all the stocks held (with a price) on the last day.
+    '''
+    last = len(stock_prices) - 1
+    stocks = np.nonzero(~np.isnan(stock_prices[last]) & (portfolio.shares > 0))[0]
+    portfolio.sell_many(last, stocks, stock_prices, fees, ledger)
+
+@instrument.timed('random')
 def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.txt'):
     '''
     Randomly decides, every period, which stocks to purchase,
@@ -10,21 +28,22 @@ def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.t
     Spends a maximum of amount on every purchase.
 
     Input:
-        stock_prices (ndarray): the stock price data
+        stock_prices (ndarray): the stock price data (can be memory-mapped,
+            only the rows of the trading days are read)
         period (int, default 7): how often we buy/sell (days)
         amount (float, default 5000): how much we spend on each purchase
             (must cover fees)
         fees (float, default 20): transaction fees
-        ledger (str): path to the ledger file
+        ledger (str or LedgerWriter): path to the ledger file
 
     Output: None
     '''
 
     N = len(stock_prices[0])
+    #buffers the transactions, the ledger file is written in bulk
+    ledger = proc.as_ledger_writer(ledger)
     #creates inital portfolio
     portfolio = proc.create_portfolio([amount] * N, stock_prices, fees, ledger)
-    #creates array of boolean data to check if the stock prices are NaN or not
-    nan_check = np.isnan(stock_prices)
     #loops through each date other a set period
     #period - 1 as it is the 7th day after the portfolio was created
     for date in range(period - 1, len(stock_prices)-1, period):
@@ -34,22 +53,56 @@ def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.t
         num_stocks = np.random.randint(0,len(stock_prices[0]) + 1)
         #gets a random array of numbers that represent a the index of the stocks in stock_prices
         stocks = np.random.choice(len(stock_prices[0]), num_stocks, replace=False)
+        #checks if the stock prices are NaN or not, on this date only
+        nan_check = np.isnan(stock_prices[date][stocks])
         if choice == 'buy':
-            for stock in stocks:
-                if nan_check[date][stock] == False:
-                    proc.buy(date, stock, amount, stock_prices, fees, portfolio, ledger)
+            portfolio.buy_many(date, stocks[~nan_check], amount, stock_prices, fees, ledger)
+            if instrument.enabled:
+                instrument.count('random.nan_skipped', np.sum(nan_check))
         if choice == 'sell':
-            for stock in stocks:
-                if nan_check[date][stock] == False and portfolio[stock] > 0:
-                    proc.sell(date, stock, stock_prices, fees, portfolio, ledger)
+            sold = ~nan_check & (portfolio.shares[stocks] > 0)
+            portfolio.sell_many(date, stocks[sold], stock_prices, fees, ledger)
     # Sell all the stocks on the last day
-    for stock in range(len(portfolio)):
-        if nan_check[len(stock_prices)-1][stock] == False and portfolio[stock] > 0:
-            proc.sell(len(stock_prices)-1, stock, stock_prices, fees, portfolio, ledger)
+    _sell_all(stock_prices, fees, portfolio, ledger)
+    ledger.flush()
     return None
 
 
-def crossing_averages(stock_prices, n=50, m=200, amount=5000, weights_n=[], weights_m=[], fees=20, ledger='ledger_crossing_averages.txt'):
+def _crossing_block(block, start, n, m, amount, weights_n, weights_m, fees, stock_prices, portfolio, ledger, dtype=None):
+    '''
+    Runs crossing_averages() on one block of stocks (columns start onwards), trading
+    stock by stock in date order. Returns the block's FMA and SMA.
+    '''
+    N = len(block[0])
+    #creates array of boolean values to check if the stock prices are NaN or not
+    nan_check = np.isnan(block)
+    #moving averages for every stock at once (reused from earlier runs on the same data)
+    with instrument.stage('crossing_averages.indicators'):
+        SMA = indicator_cache.moving_averages(block, n, weights_n, dtype=dtype)
+        FMA = indicator_cache.moving_averages(block, m, weights_m, dtype=dtype)
+    if instrument.enabled:
+        instrument.count('crossing_averages.indicator_calls', 2)
+        instrument.count('crossing_averages.nan_skipped', np.sum(np.isnan(SMA) | np.isnan(FMA)))
+    #previous day's averages, there is no previous day for day 0
+    nan_row = np.full((1, N), np.nan)
+    SMA_prev = np.concatenate([nan_row, SMA[:-1]])
+    FMA_prev = np.concatenate([nan_row, FMA[:-1]])
+    #comparisons with NaN are False, so days where an average is NaN never cross
+    #Decided if they are equal then they should treat it as if it crossed
+    cross_up = (FMA >= SMA) & (FMA_prev < SMA_prev)
+    cross_down = (FMA <= SMA) & (FMA_prev > SMA_prev)
+    #loops through the crossings only (on days with a price), stock by stock in date order
+    stocks, dates = np.nonzero(((cross_up | cross_down) & ~nan_check).T)
+    with instrument.stage('crossing_averages.trading'):
+        for stock, date in zip(stocks.tolist(), dates.tolist()):
+            if cross_up[date][stock]:
+                proc.buy(date, start + stock, amount, stock_prices, fees, portfolio, ledger)
+            elif portfolio[start + stock] > 0:
+                proc.sell(date, start + stock, stock_prices, fees, portfolio, ledger)
+    return FMA, SMA
+
+@instrument.timed('crossing_averages')
+def crossing_averages(stock_prices, n=50, m=200, amount=5000, weights_n=[], weights_m=[], fees=20, ledger='ledger_crossing_averages.txt', block_size=None, dtype=None):
     '''
     Calculates a slow moving average (SMA) and a fast moving average (FMA).  Strategy is
     on the FMA crossing the SMA.  If it crosses as the FMA is increasing but the SMA is decreasing
@@ -57,7 +110,7 @@ def crossing_averages(stock_prices, n=50, m=200, amount=5000, weights_n=[], weig
     Spends a maximum of amount on every purchase.
 
     Input:
-    stock_prices (ndarray): the stock price data
+    stock_prices (ndarray): the stock price data (can be memory-mapped, see block_size)
     n (int, default 50): Slow moving average period (days)
     m (int, default 200): Fast moving average period (days)
     amount (float, default 5000): how much we spend on each purchase
@@ -67,88 +120,135 @@ def crossing_averages(stock_prices, n=50, m=200, amount=5000, weights_n=[], weig
     weights_m (list, default []): must be of length n if specified. Indicates the weights
         to use for the weighted average. If empty, return a non-weighted average.
     fees (float, default 20): transaction fees
-    ledger (str): path to the ledger file
+    ledger (str or LedgerWriter): path to the ledger file
+    block_size (int, default None): if specified, load and process the stocks this many
+        columns at a time, so memory depends on the block size and not on the number
+        of stocks. The ledger is the same as without blocks.
+    dtype (default None): dtype of the moving averages, e.g. np.float32 to halve their
+        memory (the prices are loaded as this dtype too). Trades are still priced in float64.
+        If None, the dtype of stock_prices.
 
-    Output: FMA (ndarray): Fast moving average data
-            SMA (ndarray): Slow moving average data
+    Output: FMA (ndarray): Fast moving average data (for the last stock)
+            SMA (ndarray): Slow moving average data (for the last stock)
     '''
 
     N = len(stock_prices[0])
+    #buffers the transactions, the ledger file is written in bulk
+    ledger = proc.as_ledger_writer(ledger)
     #creates inital portfolio
     portfolio = proc.create_portfolio([amount] * N, stock_prices, fees, ledger)
-    #creates array of boolean values to check if the stock prices are NaN or not
-    nan_check = np.isnan(stock_prices)
-    #loops through each stock
-    for stock in range(N):
-        stock_price = stock_prices[:,stock]
-        SMA = ind.moving_average(stock_price, n, weights_n)
-        FMA = ind.moving_average(stock_price, m, weights_m)
-        nan_check_SMA = np.isnan(SMA)
-        nan_check_FMA = np.isnan(FMA)
-        #loops through each date
-        for date in range(len(stock_prices)):
-            if nan_check_SMA[date] == True or nan_check_FMA[date] == True:
-                pass
-            else:
-                #Decided if they are equal then they should treat it as if it crossed
-                if FMA[date] >= SMA[date] and FMA[date-1] < SMA[date-1]:
-                    proc.buy(date, stock, amount, stock_prices, fees, portfolio, ledger)
-                if FMA[date] <= SMA[date] and FMA[date-1] > SMA[date-1]:
-                    if portfolio[stock] > 0:
-                        proc.sell(date, stock, stock_prices, fees, portfolio, ledger)
+    #loops through each block of stocks, in order
+    for start, stop in _blocks(N, block_size):
+        block = np.asarray(stock_prices[:, start:stop], dtype=dtype)
+        FMA, SMA = _crossing_block(block, start, n, m, amount, weights_n, weights_m, fees,
+                                   stock_prices, portfolio, ledger, dtype)
     #Sell all the stocks on the last day
-    for stock in range(len(portfolio)):
-        if nan_check[len(stock_prices)-1][stock] == False and portfolio[stock] > 0:
-            proc.sell(len(stock_prices)-1, stock, stock_prices, fees, portfolio, ledger)
-    return FMA, SMA
+    _sell_all(stock_prices, fees, portfolio, ledger)
+    ledger.flush()
+    return FMA[:,-1], SMA[:,-1]
 
-def momentum(stock_prices, osc_type='stochastic', n=7, cool_off=7, amount=5000, fees=20, ledger='ledger_momentum.txt'):
+def _momentum_block(block, start, osc_type, n, cool_off, amount, fees, stock_prices, portfolio, ledger, dtype=None):
+    '''
+    Runs momentum() on one block of stocks (columns start onwards), logging the trades
+    stock by stock in date order. The oscillator is computed from block (in dtype) and
+    the trades are priced from stock_prices. Returns the block's oscillator.
+    '''
+    N = len(block[0])
+    #oscillator for every stock at once (reused from earlier runs on the same data)
+    with instrument.stage('momentum.indicators'):
+        osc = indicator_cache.oscillators(block, n, osc_type, dtype=dtype)
+    if instrument.enabled:
+        instrument.count('momentum.indicator_calls')
+        instrument.count('momentum.nan_skipped', np.sum(np.isnan(osc)))
+    #comparisons with NaN are False, so NaN oscillator days are skipped
+    sell_band = (0.7 <= osc) & (osc <= 0.8)
+    buy_band = (0.2 <= osc) & (osc <= 0.3)
+    #steps through the dates once, for all stocks together: each stock can trade again
+    #from next_date (cool_off days after its last trade)
+    held = portfolio.shares[start:start + N].copy()
+    next_date = np.zeros(N, dtype=np.int64)
+    trades = []
+    rejected = 0
+    with instrument.stage('momentum.trading'):
+        for date in np.nonzero((sell_band | buy_band).any(axis=1))[0].tolist():
+            ready = next_date <= date
+            #shares are sized and logged with the float64 prices, whatever the dtype of the block
+            prices = np.asarray(stock_prices[date, start:start + N], dtype=np.float64)
+            sell = ready & sell_band[date] & (held > 0)
+            buy = ready & buy_band[date]
+            if sell.any():
+                stocks = np.nonzero(sell)[0]
+                trades.append(('sell', date, stocks, held[stocks], -prices[stocks]))
+                held[stocks] = 0
+            if buy.any():
+                stocks = np.nonzero(buy)[0]
+                number_of_shares = ((amount - fees) / prices[stocks]).astype(np.int64)
+                bought = number_of_shares > 0
+                rejected += np.count_nonzero(~bought)
+                trades.append(('buy', date, stocks[bought], number_of_shares[bought], prices[stocks[bought]]))
+                held[stocks[bought]] += number_of_shares[bought]
+            #the cool off applies after a trade, and after a buy without enough capital
+            next_date[sell | buy] = date + cool_off
+    for _ in range(rejected):
+        print('You do not have enough capital to buy these shares.')
+    if trades:
+        types = np.concatenate([np.full(len(t[2]), t[0]) for t in trades])
+        dates = np.concatenate([np.full(len(t[2]), t[1]) for t in trades])
+        stocks = np.concatenate([t[2] for t in trades]) + start
+        number_of_shares = np.concatenate([t[3] for t in trades])
+        prices = np.concatenate([t[4] for t in trades])
+        #logs the trades stock by stock, in date order
+        order = np.lexsort((dates, stocks))
+        proc.log_transactions(types[order], dates[order], stocks[order], number_of_shares[order],
+                              prices[order], fees, ledger)
+        portfolio.shares[start:start + N] = held
+        portfolio.cash += np.sum((-number_of_shares * prices) - fees)
+        if instrument.enabled:
+            instrument.count('buy.trades', np.count_nonzero(types == 'buy'))
+            instrument.count('sell.trades', np.count_nonzero(types == 'sell'))
+    if instrument.enabled:
+        instrument.count('buy.rejected', rejected)
+    return osc
+
+@instrument.timed('momentum')
+def momentum(stock_prices, osc_type='stochastic', n=7, cool_off=7, amount=5000, fees=20, ledger='ledger_momentum.txt', block_size=None, dtype=None):
     '''
         Uses the oscillators RSI or stochastic to determine when to sell and buy.
         Spends a maximum of amount on every purchase.
 
         Input:
-        stock_prices (ndarray): the stock price data
+        stock_prices (ndarray): the stock price data (can be memory-mapped, see block_size)
         osc_type (str, default stochastic): RSI or stochastic
         n (int, default 7): Period (days)
         cool_off (int, default 7): Cool off period for buying or selling
         amount (float, default 5000): how much we spend on each purchase
             (must cover fees)
         fees (float, default 20): transaction fees
-        ledger (str): path to the ledger file
+        ledger (str or LedgerWriter): path to the ledger file
+        block_size (int, default None): if specified, load and process the stocks this many
+            columns at a time, so memory depends on the block size and not on the number
+            of stocks. The ledger is the same as without blocks.
+        dtype (default None): dtype of the oscillator, e.g. np.float32 to halve its memory
+            (the prices are loaded as this dtype too). Trades are still priced in float64.
+            If None, the dtype of stock_prices.
 
         Output:
-        osc (ndarray): The oscillator data
+        osc (ndarray): The oscillator data, for every stock
+            (None if block_size is specified, so it is never held in memory)
     '''
 
     N = len(stock_prices[0])
+    #buffers the transactions, the ledger file is written in bulk
+    ledger = proc.as_ledger_writer(ledger)
     #creates inital portfolio
     portfolio = proc.create_portfolio([amount] * N, stock_prices, fees, ledger)
-    #creates array of boolean values to check if the stock prices are NaN or not
-    nan_check = np.isnan(stock_prices)
-    for stock in range(N):
-    #loops through each stock
-        stock_price = stock_prices[:,stock]
-        if osc_type == 'stochastic':
-            osc = ind.oscillator(stock_price, n, 'stochastic')
-        elif osc_type == 'RSI':
-            osc = ind.oscillator(stock_price, n, 'RSI')
-        nan_check_osc = np.isnan(osc)
-        #reset the date count
-        date = 0
-        #use while loop so cool_off time could be added easily
-        while date < len(stock_prices):
-            if nan_check_osc[date] == False:
-                if 0.7 <= osc[date] <= 0.8:
-                    if portfolio[stock] > 0:
-                        proc.sell(date, stock, stock_prices, fees, portfolio, ledger)
-                        date += (cool_off - 1)
-                elif 0.2 <= osc[date] <= 0.3:
-                    proc.buy(date, stock, amount, stock_prices, fees, portfolio, ledger)
-                    date += (cool_off - 1)
-            date += 1
+    #loops through each block of stocks, in order (a single block if block_size is None)
+    osc = None
+    for start, stop in _blocks(N, block_size):
+        block = np.asarray(stock_prices[:, start:stop], dtype=dtype)
+        osc = _momentum_block(block, start, osc_type, n, cool_off, amount, fees, stock_prices,
+                              portfolio, ledger, dtype)
     #Sell all the stocks on the last day
-    for stock in range(len(portfolio)):
-        if nan_check[len(stock_prices)-1][stock] == False and portfolio[stock] > 0:
-            proc.sell(len(stock_prices)-1, stock, stock_prices, fees, portfolio, ledger)
-    return osc
+    _sell_all(stock_prices, fees, portfolio, ledger)
+    ledger.flush()
+    return osc if block_size is None else None
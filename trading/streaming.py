@@ -0,0 +1,199 @@
+# Incremental versions of the indicators, updated one day (tick) at a time.
+import numpy as np
+from collections import deque
+
+
+def _as_prices(price):
+    '''
+    Returns price as a 1D float array (one value per stock).
+    '''
+    return np.atleast_1d(np.asarray(price, dtype=float))
+
+def _as_output(price, values):
+    '''
+    Returns values as a float if price was a single value, otherwise as an array.
+    '''
+    return values if np.ndim(price) else float(values[0])
+
+
+class _RollingSum:
+    '''
+    Running n-day window sum. The last n days are kept and each window is summed on its
+    own, in the same order as indicators._rolling_sum(), so the result is identical.
+    Any NaN in the window makes its sum NaN.
+    '''
+
+    def __init__(self, n):
+        self.n = n
+        self.window = deque(maxlen=n)
+
+    def update(self, values):
+        self.window.append(values)
+        #not enough days for a full window yet
+        if len(self.window) < self.n:
+            return np.full(values.shape, np.nan)
+        return np.sum(np.stack(self.window, axis=-1), axis=-1, dtype=np.float64)
+
+
+class MovingAverage:
+    '''
+    Streaming n-day (possibly weighted) moving average, matching indicators.moving_averages().
+
+    Input:
+        n (int, default 7): period of the moving average (in days).
+        weights (list, default []): must be of length n if specified. Indicates the weights
+            to use for the weighted average. If empty, use a non-weighted average.
+        ma_type (str, default 'simple'): either 'simple' or 'exponential'.
+
+    update(price) takes today's price (one value, or an array with one value per stock)
+    and returns today's moving average, which uses the n days before today. The first
+    n updates return NaN. Exponential averages update in O(1), simple and weighted
+    averages in O(n).
+    '''
+
+    def __init__(self, n=7, weights=[], ma_type='simple'):
+        self.n = n
+        self.weights = np.asarray(weights, dtype=float)
+        self.ma_type = ma_type
+        self.window = deque(maxlen=n)
+        self.rolling = _RollingSum(n)
+        self.ma = None
+
+    def update(self, price):
+        prices = _as_prices(price)
+        #today's average was computed from the previous n days
+        if self.ma is None:
+            self.ma = np.full(prices.shape, np.nan)
+        today = self.ma
+        if self.ma_type == 'exponential':
+            if len(self.window) < self.n:
+                self.window.append(prices)
+                if len(self.window) == self.n:
+                    self.ma = np.mean(np.stack(self.window), axis=0)
+            else:
+                alpha = 2 / (self.n + 1)
+                self.ma = alpha * prices + (1 - alpha) * self.ma
+        elif len(self.weights) > 0:
+            self.window.append(prices)
+            if len(self.window) == self.n:
+                total = np.zeros(prices.shape)
+                for j in range(self.n):
+                    total += self.weights[j] * self.window[j]
+                self.ma = total / self.n
+        else:
+            self.ma = self.rolling.update(prices) / self.n
+        return _as_output(price, today)
+
+
+class Stochastic:
+    '''
+    Streaming stochastic oscillator with a period of n days, matching
+    indicators.oscillators(osc_type='stochastic').
+
+    update(price) takes today's price (one value, or an array with one value per stock)
+    and returns today's oscillator level. The highest and lowest prices of the window
+    are kept in monotonic deques, so each update is O(1) amortized per stock.
+    '''
+
+    def __init__(self, n=7):
+        self.n = n
+        self.day = -1
+        self.highs = None
+        self.lows = None
+        self.last_nan = None
+
+    def update(self, price):
+        prices = _as_prices(price)
+        if self.highs is None:
+            self.highs = [deque() for _ in prices]
+            self.lows = [deque() for _ in prices]
+            self.last_nan = np.full(prices.shape, -self.n)
+        self.day += 1
+        for j, p in enumerate(prices):
+            if np.isnan(p):
+                self.last_nan[j] = self.day
+                continue
+            highs = self.highs[j]
+            lows = self.lows[j]
+            #drop the days that can no longer be the highest/lowest of the window
+            while highs and highs[-1][1] <= p:
+                highs.pop()
+            while lows and lows[-1][1] >= p:
+                lows.pop()
+            highs.append((self.day, p))
+            lows.append((self.day, p))
+            #drop the days that have left the window
+            while highs[0][0] <= self.day - self.n:
+                highs.popleft()
+            while lows[0][0] <= self.day - self.n:
+                lows.popleft()
+        osc = np.full(prices.shape, np.nan)
+        #a NaN price anywhere in the window gives NaN
+        valid = (self.day - self.last_nan) >= self.n
+        if self.day >= self.n - 1 and valid.any():
+            highest = np.array([h[0][1] if h else np.nan for h in self.highs])
+            lowest = np.array([l[0][1] if l else np.nan for l in self.lows])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                osc = np.where(valid, (prices - lowest) / (highest - lowest), np.nan)
+        return _as_output(price, osc)
+
+
+class RSI:
+    '''
+    Streaming RSI with a period of n days, matching indicators.oscillators(osc_type='RSI').
+
+    Input:
+        n (int, default 7): period of the oscillator (in days).
+        smoothing (str, default 'simple'): either 'simple' or 'wilder'.
+
+    update(price) takes today's price (one value, or an array with one value per stock)
+    and returns today's RSI level, in O(n) per stock (O(1) with Wilder smoothing). The
+    first n-1 updates return NaN.
+    '''
+
+    def __init__(self, n=7, smoothing='simple'):
+        self.n = n
+        self.smoothing = smoothing
+        self.previous = None
+        self.gains = _RollingSum(n - 1)
+        self.losses = _RollingSum(n - 1)
+        self.loss_count = _RollingSum(n - 1)
+        self.first_diffs = []
+        self.pos_avg = None
+        self.neg_avg = None
+
+    def update(self, price):
+        prices = _as_prices(price)
+        previous = self.previous
+        self.previous = prices
+        osc = np.full(prices.shape, np.nan)
+        if previous is None:
+            return _as_output(price, osc)
+        #difference with the previous day, split into gain or loss
+        diff = prices - previous
+        loss = diff < 0
+        gains = np.where(loss, 0, diff)
+        losses = np.where(loss, diff, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.smoothing == 'wilder':
+                period = self.n - 1
+                if self.pos_avg is None:
+                    self.first_diffs.append((gains, losses))
+                    if len(self.first_diffs) < period:
+                        return _as_output(price, osc)
+                    self.pos_avg = np.mean(np.stack([g for g, l in self.first_diffs]), axis=0)
+                    self.neg_avg = -np.mean(np.stack([l for g, l in self.first_diffs]), axis=0)
+                    self.first_diffs = []
+                else:
+                    self.pos_avg = (self.pos_avg * (period - 1) + gains) / period
+                    self.neg_avg = (self.neg_avg * (period - 1) - losses) / period
+                rs = self.pos_avg / self.neg_avg
+                osc = np.where(self.neg_avg == 0, 1, 1 - (1 / (1 + rs)))
+                return _as_output(price, osc)
+            neg_count = self.loss_count.update(loss.astype(float))
+            pos_count = (self.n - 1) - neg_count
+            pos_avg = self.gains.update(gains) / pos_count
+            neg_avg = np.abs(self.losses.update(losses) / neg_count)
+            rs = np.where(neg_count == 0, pos_avg, np.where(pos_count == 0, neg_avg, pos_avg / neg_avg))
+            osc = 1 - (1 / (1 + rs))
+        return _as_output(price, osc)
@@ -0,0 +1,72 @@
+# Parallel parameter sweeps over the strategies, sharing the price data between processes.
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from trading import strategy as strat
+from trading import process as proc
+from trading import performance as perf
+
+def parameter_grid(**params):
+    '''
+    Builds every combination of the given parameter values.
+
+    Input:
+        params: one list of values per strategy argument,
+            e.g. parameter_grid(n=[20, 50], m=[100, 200])
+
+    Output:
+        grid (list): one dict of strategy arguments per combination
+    '''
+    names = list(params)
+    return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+def _run_config(task):
+    '''
+    Runs one strategy configuration on the shared price data, in a worker process.
+    The ledger is kept in memory and only its summary is returned.
+    '''
+    shm_name, shape, dtype, strategy, config = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        stock_prices = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        ledger = proc.LedgerWriter(None)
+        getattr(strat, strategy)(stock_prices, ledger=ledger, **config)
+        summary = perf.transactions_summary(ledger.transactions())
+        del stock_prices
+    finally:
+        shm.close()
+    return summary
+
+def sweep(stock_prices, strategy, grid, processes=None):
+    '''
+    Runs a strategy for every configuration of a parameter grid, across a process pool.
+    The price data is copied once into shared memory, so it is not sent to every worker.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        strategy (str): name of the strategy in trading.strategy,
+            e.g. 'crossing_averages' or 'momentum'
+        grid (list): one dict of strategy arguments per configuration (see parameter_grid()),
+            the ledger argument is ignored
+        processes (int, default None): number of worker processes (default: number of CPUs)
+
+    Output:
+        results (list): (config, summary) for each configuration, in grid order,
+            where summary is as returned by performance.ledger_summary()
+    '''
+    stock_prices = np.asarray(stock_prices)
+    shm = shared_memory.SharedMemory(create=True, size=max(stock_prices.nbytes, 1))
+    try:
+        shared = np.ndarray(stock_prices.shape, dtype=stock_prices.dtype, buffer=shm.buf)
+        shared[:] = stock_prices
+        configs = [{k: v for k, v in config.items() if k != 'ledger'} for config in grid]
+        tasks = [(shm.name, stock_prices.shape, stock_prices.dtype.str, strategy, config)
+                 for config in configs]
+        with ProcessPoolExecutor(processes) as pool:
+            summaries = list(pool.map(_run_config, tasks))
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+    return list(zip(configs, summaries))
@@ -0,0 +1 @@
+# This file can stay empty. It's just here to tell Python that `transit` is a package and not just a folder.
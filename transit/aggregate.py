@@ -0,0 +1,82 @@
+# Per-district totals over the road layer (e.g. road length per local authority district).
+import csv
+import numpy as np
+from transit.spatial import RoadDistrictIndex
+
+def road_segments(coords, parts, records):
+    '''
+    Splits polylines into their straight segments and measures them.
+
+    Input:
+        coords, parts, records (ndarray): the layer, as returned by shapefile.read_shapefile()
+
+    Output:
+        starts (ndarray): index in coords of the first point of each segment
+            (the segment joins coords[starts] and coords[starts + 1])
+        roads (ndarray): record (road) of each segment
+        lengths (ndarray): length of each segment, in the units of the coordinates
+            (metres for the British National Grid)
+    '''
+    #a segment starts at every point except the last point of each part
+    valid = np.ones(len(coords), dtype=bool)
+    valid[parts[1:] - 1] = False
+    starts = np.nonzero(valid)[0]
+    points_per_road = parts[records[1:]] - parts[records[:-1]]
+    roads = np.repeat(np.arange(len(points_per_road)), points_per_road)[starts]
+    delta = coords[starts + 1] - coords[starts]
+    lengths = np.hypot(delta[:, 0], delta[:, 1])
+    return starts, roads, lengths
+
+def road_length_by_district(index=None, attributes=('Shape__Area',)):
+    '''
+    Totals the length of the roads in each district. Every segment is assigned to the
+    district containing its midpoint (segments outside all districts are left out), and
+    the lengths are summed per district with bincount.
+
+    Input:
+        index (RoadDistrictIndex, default None): the roads and districts, built if None
+        attributes (tuple, default ('Shape__Area',)): columns of the district attribute
+            table to add to the output
+
+    Output: table (dict): one array per column, one row per district (in record order):
+        'LAD17CD', 'LAD17NM': code and name of the district
+        'road_length' (float): total length of the road segments, in km
+        'segments', 'roads' (int): number of segments, and of roads with a segment, in it
+        the requested attributes, and if 'Shape__Area' (m^2) is one of them,
+        'road_density' (float): road length per area, in km per km^2
+    '''
+    if index is None:
+        index = RoadDistrictIndex()
+    n = len(index.districts)
+    starts, roads, lengths = road_segments(index.road_coords, index.road_parts, index.road_records)
+    midpoints = (index.road_coords[starts] + index.road_coords[starts + 1]) / 2
+    districts = index.districts.locate(midpoints)
+    inside = districts >= 0
+    districts, roads, lengths = districts[inside], roads[inside], lengths[inside]
+    #each (district, road) pair once, to count the roads in each district
+    pairs = np.unique(districts * len(index.road_records) + roads)
+    table = {'LAD17CD': index.codes, 'LAD17NM': index.names,
+             'road_length': np.bincount(districts, weights=lengths, minlength=n) / 1000,
+             'segments': np.bincount(districts, minlength=n),
+             'roads': np.bincount(pairs // len(index.road_records), minlength=n)}
+    for column in attributes:
+        table[column] = index.attributes[column]
+    if 'Shape__Area' in attributes:
+        table['road_density'] = table['road_length'] / (index.attributes['Shape__Area'] / 1e6)
+    return table
+
+def write_table(table, csv_file):
+    '''
+    Saves a table (dict of columns, e.g. from road_length_by_district()) as CSV.
+
+    Input:
+        table (dict): one array per column, all of the same length
+        csv_file (str): path to the CSV file
+
+    Output: None
+    '''
+    columns = list(table)
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*(np.asarray(table[column]).tolist() for column in columns)))
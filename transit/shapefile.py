@@ -0,0 +1,245 @@
+# Memory-mapped reader for the ESRI shapefiles in shape_files (no GIS dependencies).
+import csv
+import json
+import os
+import numpy as np
+
+#folder holding the shapefiles, and the layers in it (paths without extension)
+SHAPE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shape_files')
+MRDB_FILE = os.path.join(SHAPE_FOLDER, 'MRDB_2019_published')
+LAD_FILE = os.path.join(SHAPE_FOLDER, 'Local_Authority_Districts__December_2017__Boundaries_GB_BSC')
+SCOTLAND_ROADS_FILE = os.path.join(SHAPE_FOLDER, 'scotland_roads_inx.txt')
+#attribute table of the LAD layer (one row per record, in record order)
+LAD_CSV_FILE = LAD_FILE + '.csv'
+
+#shape types whose records start with a bounding box, parts and x, y points
+#(polyline, polygon and their Z and M variants, whose extra values are ignored)
+POLY_TYPES = (3, 5, 13, 15, 23, 25)
+NULL_SHAPE = 0
+
+#offsets in bytes inside a record: the record header (number and length, big-endian),
+#then shape type, bounding box, number of parts, number of points and the parts
+_SHAPE_TYPE = 8
+_BBOX = 12
+_NUM_PARTS = 44
+_NUM_POINTS = 48
+_PARTS = 52
+
+def _ranges(starts, counts):
+    '''
+    Concatenates the ranges starts[i] to starts[i] + counts[i] - 1, without a Python loop.
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    total = counts.sum()
+    first = np.cumsum(counts) - counts
+    return np.repeat(np.asarray(starts, dtype=np.int64) - first, counts) + np.arange(total)
+
+def _gather(buffer, dtype, starts, counts):
+    '''
+    Reads counts[i] values of dtype at byte offset starts[i] of buffer, for every i,
+    into one flat array. Values may be unaligned: the offsets are grouped by alignment
+    and each group is read through its own view of the buffer.
+    '''
+    dtype = np.dtype(dtype)
+    starts = np.asarray(starts, dtype=np.int64)
+    counts = np.broadcast_to(np.asarray(counts, dtype=np.int64), starts.shape)
+    values = np.empty(counts.sum(), dtype=dtype)
+    positions = np.cumsum(counts) - counts
+    shifts = starts % dtype.itemsize
+    for shift in np.unique(shifts).tolist():
+        group = shifts == shift
+        view = np.ndarray(((len(buffer) - shift) // dtype.itemsize,), dtype=dtype, buffer=buffer, offset=shift)
+        values[_ranges(positions[group], counts[group])] = view[_ranges((starts[group] - shift) // dtype.itemsize, counts[group])]
+    return values
+
+def read_header(buffer):
+    '''
+    Reads the 100 byte header of a .shp or .shx file.
+
+    Input:
+        buffer (ndarray): the file contents (e.g. memory-mapped), as uint8
+
+    Output:
+        shape_type (int): shape type of the layer (3 polyline, 5 polygon, ...)
+        bbox (ndarray): bounding box of the layer, (xmin, ymin, xmax, ymax)
+    '''
+    if len(buffer) < 100 or int(np.ndarray((), '>i4', buffer=buffer)) != 9994:
+        raise ValueError('Not a shapefile: the file code is not 9994.')
+    shape_type = int(np.ndarray((), '<i4', buffer=buffer, offset=32))
+    bbox = np.ndarray((4,), '<f8', buffer=buffer, offset=36).copy()
+    return shape_type, bbox
+
+def load_indices(index_file=SCOTLAND_ROADS_FILE):
+    '''
+    Reads a list of record indices saved as text, e.g. [4, 5, 6, ...].
+
+    Input:
+        index_file (str, default SCOTLAND_ROADS_FILE): path to the index list
+            (by default the MRDB records of the roads in Scotland)
+
+    Output: indices (ndarray): the record indices
+    '''
+    with open(index_file) as f:
+        return np.array(json.load(f), dtype=np.int64)
+
+def read_attributes(csv_file=LAD_CSV_FILE):
+    '''
+    Reads the attribute table of a layer, saved as CSV with one row per record.
+
+    Input:
+        csv_file (str, default LAD_CSV_FILE): path to the CSV file
+
+    Output: attributes (dict): one array per column, float if every value of the
+        column is a number, otherwise str
+    '''
+    #utf-8-sig skips the byte order mark at the start of the LAD file
+    with open(csv_file, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        rows = list(reader)
+    attributes = {}
+    for j, column in enumerate(columns):
+        values = np.array([row[j] for row in rows])
+        try:
+            attributes[column] = values.astype(np.float64)
+        except ValueError:
+            attributes[column] = values
+    return attributes
+
+class ShapeFile:
+    '''
+    Shapefile layer (.shp and .shx) read through a memory map. Only the .shx index and
+    the per-record counts are read when the layer is opened. Coordinates are read when
+    they are asked for, either a single record at a time (as views of the file, without
+    copying) or many records at once into flat arrays, without any per-record objects.
+
+    Input:
+        path (str): path to the layer, with or without the .shp extension
+
+    Attributes:
+        shape_type (int): shape type of the layer (3 polyline, 5 polygon, ...)
+        bbox (ndarray): bounding box of the layer, (xmin, ymin, xmax, ymax)
+        offsets (ndarray): byte offset of each record in the .shp file
+        record_types (ndarray): shape type of each record (0 for null shapes)
+        num_parts, num_points (ndarray): number of parts and of points of each record
+
+    Use as a context manager, or call close() to release the memory map.
+    '''
+
+    def __init__(self, path):
+        root = path[:-4] if path.lower().endswith('.shp') else path
+        self.path = root + '.shp'
+        self.data = np.memmap(self.path, dtype=np.uint8, mode='r')
+        self.shape_type, self.bbox = read_header(self.data)
+        if self.shape_type not in POLY_TYPES:
+            raise ValueError(f'Shape type {self.shape_type} is not supported, only polylines and polygons.')
+        #.shx: one (offset, content length) pair per record, in 16-bit words, big-endian
+        index = np.fromfile(root + '.shx', dtype='>i4', offset=100).reshape(-1, 2)
+        self.offsets = index[:, 0].astype(np.int64) * 2
+        self.record_types = _gather(self.data, '<i4', self.offsets + _SHAPE_TYPE, 1)
+        #null shapes have no parts or points (their record stops after the shape type)
+        poly = self.record_types != NULL_SHAPE
+        self.num_parts = np.zeros(len(self.offsets), dtype=np.int64)
+        self.num_points = np.zeros(len(self.offsets), dtype=np.int64)
+        self.num_parts[poly] = _gather(self.data, '<i4', self.offsets[poly] + _NUM_PARTS, 1)
+        self.num_points[poly] = _gather(self.data, '<i4', self.offsets[poly] + _NUM_POINTS, 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        '''
+        Releases the memory map (it stays open while views returned by record() are in use).
+        '''
+        self.data = None
+
+    def _indices(self, indices):
+        if indices is None:
+            return np.arange(len(self))
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        if len(indices) and (indices.min() < -len(self) or indices.max() >= len(self)):
+            raise IndexError(f'Record index out of range for {len(self)} records.')
+        return indices % max(len(self), 1)
+
+    def bounding_boxes(self, indices=None):
+        '''
+        Reads the bounding box of records (NaN for null shapes).
+
+        Input:
+            indices (array, default None): the records to read, all of them if None
+
+        Output: bboxes (ndarray): (xmin, ymin, xmax, ymax) of each record
+        '''
+        indices = self._indices(indices)
+        bboxes = np.full((len(indices), 4), np.nan)
+        poly = self.record_types[indices] != NULL_SHAPE
+        bboxes[poly] = _gather(self.data, '<f8', self.offsets[indices[poly]] + _BBOX, 4).reshape(-1, 4)
+        return bboxes
+
+    def record(self, i):
+        '''
+        Reads one record, as views of the memory-mapped file (nothing is copied).
+
+        Input:
+            i (int): index of the record
+
+        Output:
+            points (ndarray): (num_points, 2) x, y coordinates of the record (read-only)
+            parts (ndarray): index in points of the first point of each part
+        '''
+        i = int(self._indices(i)[0])
+        offset = int(self.offsets[i])
+        num_parts = int(self.num_parts[i])
+        parts = np.ndarray((num_parts,), '<i4', buffer=self.data, offset=offset + _PARTS)
+        points = np.ndarray((int(self.num_points[i]), 2), '<f8', buffer=self.data,
+                            offset=offset + _PARTS + 4 * num_parts)
+        return points, parts
+
+    def read(self, indices=None):
+        '''
+        Reads the coordinates of many records at once into flat arrays (CSR layout):
+        the points of part j are coords[parts[j]:parts[j+1]], and the parts of the k-th
+        record read are parts[records[k]:records[k+1]].
+
+        Input:
+            indices (array, default None): the records to read, in order (all of them if
+                None), e.g. load_indices() for the roads in Scotland
+
+        Output:
+            coords (ndarray): (total points, 2) x, y coordinates of all the records read
+            parts (ndarray): offset in coords of each part, plus the total number of points
+            records (ndarray): offset in parts of each record, plus the total number of parts
+        '''
+        indices = self._indices(indices)
+        offsets = self.offsets[indices]
+        num_parts = self.num_parts[indices]
+        num_points = self.num_points[indices]
+        records = np.concatenate([[0], np.cumsum(num_parts)])
+        points_start = np.concatenate([[0], np.cumsum(num_points)])
+        #part offsets are stored relative to their record, shift them to the flat coords
+        record_parts = _gather(self.data, '<i4', offsets + _PARTS, num_parts)
+        parts = np.empty(records[-1] + 1, dtype=np.int64)
+        parts[:-1] = record_parts + np.repeat(points_start[:-1], num_parts)
+        parts[-1] = points_start[-1]
+        coords = _gather(self.data, '<f8', offsets + _PARTS + 4 * num_parts, 2 * num_points).reshape(-1, 2)
+        return coords, parts, records
+
+def read_shapefile(path, indices=None):
+    '''
+    Reads the coordinates of a shapefile layer into flat arrays, see ShapeFile.read().
+
+    Input:
+        path (str): path to the layer, with or without the .shp extension
+            (e.g. MRDB_FILE or LAD_FILE)
+        indices (array, default None): the records to read, all of them if None
+
+    Output: coords, parts, records (ndarray): see ShapeFile.read()
+    '''
+    with ShapeFile(path) as layer:
+        return layer.read(indices)
@@ -0,0 +1,267 @@
+# Multi-resolution (level of detail) geometry cache, for drawing the layers quickly.
+import os
+import numpy as np
+from transit import shapefile as shp
+from transit.spatial import GridIndex
+
+#simplification tolerance of each level (in the units of the layer, metres for the
+#British National Grid), level 0 is the full resolution
+DEFAULT_TOLERANCES = (0, 25, 100, 500, 2500)
+
+#shape types of the polygon layers (the others are polylines)
+POLYGON_TYPES = (5, 15, 25)
+
+def _segment_distance(points, a, b):
+    '''
+    Distance of each point to the segment from a to b (row by row). The ends are put in
+    a fixed order first, so a span gives the same distances in both directions.
+    '''
+    swap = (b[:, 0] < a[:, 0]) | ((b[:, 0] == a[:, 0]) & (b[:, 1] < a[:, 1]))
+    a, b = np.where(swap[:, None], b, a), np.where(swap[:, None], a, b)
+    ab = b - a
+    length2 = np.einsum('ij,ij->i', ab, ab)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(length2 > 0, np.einsum('ij,ij->i', points - a, ab) / length2, 0)
+    closest = a + np.clip(t, 0, 1)[:, None] * ab
+    return np.hypot(*(points - closest).T)
+
+def _fixed_vertices(coords, parts):
+    '''
+    Marks the vertices every level must keep: the ends of each part, and the junctions
+    where the number of parts sharing a vertex changes (where a boundary shared by two
+    districts starts or ends), so shared boundaries are simplified the same way on both
+    sides and neighbouring polygons still meet at every level.
+    '''
+    fixed = np.zeros(len(coords), dtype=bool)
+    fixed[parts[:-1]] = True
+    fixed[parts[1:] - 1] = True
+    #number of parts using each coordinate (the closing point of a ring is not counted)
+    closing = np.zeros(len(coords), dtype=bool)
+    closing[parts[1:] - 1] = (coords[parts[1:] - 1] == coords[parts[:-1]]).all(axis=1)
+    _, inverse, counts = np.unique(coords, axis=0, return_inverse=True, return_counts=True)
+    closing_counts = np.bincount(inverse.reshape(-1)[closing], minlength=len(counts))
+    shared = (counts - closing_counts)[inverse.reshape(-1)]
+    fixed[1:] |= shared[1:] != shared[:-1]
+    fixed[:-1] |= shared[:-1] != shared[1:]
+    fixed |= shared > 2
+    #a vertex fixed in one part is fixed in every part using it
+    fixed_coords = np.zeros(len(counts), dtype=bool)
+    fixed_coords[inverse.reshape(-1)[fixed]] = True
+    return fixed_coords[inverse.reshape(-1)]
+
+def vertex_significance(coords, parts, fixed=None):
+    '''
+    Runs the Douglas-Peucker simplification once for every tolerance: the significance
+    of a vertex is the largest tolerance at which it is kept, so the level for a tolerance
+    is simply the vertices with significance >= tolerance. Every span of every part is
+    split at once, one recursion depth per iteration.
+
+    Input:
+        coords, parts (ndarray): the points and part offsets of the layer
+            (see shapefile.ShapeFile.read())
+        fixed (ndarray, default None): vertices always kept (significance inf), by default
+            the ends of each part
+
+    Output: significance (ndarray): one value per vertex
+    '''
+    if fixed is None:
+        fixed = np.zeros(len(coords), dtype=bool)
+        fixed[parts[:-1]] = True
+        fixed[parts[1:] - 1] = True
+    significance = np.where(fixed, np.inf, 0.0)
+    #spans between consecutive fixed vertices of the same part
+    ends = np.nonzero(fixed)[0]
+    last = np.zeros(len(coords), dtype=bool)
+    last[parts[1:] - 1] = True
+    start, stop = ends[:-1], ends[1:]
+    within = ~last[start]
+    start, stop = start[within], stop[within]
+    parent = np.full(len(start), np.inf)
+    while len(start):
+        split = stop - start > 1
+        start, stop, parent = start[split], stop[split], parent[split]
+        if not len(start):
+            break
+        counts = stop - start - 1
+        interior = shp._ranges(start + 1, counts)
+        span = np.repeat(np.arange(len(start)), counts)
+        distance = _segment_distance(coords[interior], coords[start[span]], coords[stop[span]])
+        offsets = np.cumsum(counts) - counts
+        largest = np.maximum.reduceat(distance, offsets)
+        #first vertex of each span at the largest distance
+        vertex = np.minimum.reduceat(np.where(distance == largest[span], interior, len(coords)), offsets)
+        #a vertex is never more significant than the span it splits, so levels are nested
+        value = np.minimum(largest, parent)
+        significance[vertex] = value
+        start, stop, parent = np.concatenate([start, vertex]), np.concatenate([vertex, stop]), np.concatenate([value, value])
+    return significance
+
+def _select(coords, parts, records, indices):
+    '''
+    Keeps only the records indices of a layer given as flat arrays.
+    '''
+    first = records[indices]
+    part_counts = records[indices + 1] - first
+    part_ids = shp._ranges(first, part_counts)
+    point_counts = parts[part_ids + 1] - parts[part_ids]
+    new_coords = coords[shp._ranges(parts[part_ids], point_counts)]
+    new_parts = np.concatenate([[0], np.cumsum(point_counts)])
+    new_records = np.concatenate([[0], np.cumsum(part_counts)])
+    return new_coords, new_parts, new_records
+
+def _level(coords, parts, records, significance, part_size, largest, tolerance, polygons):
+    '''
+    Builds the simplified layer for one tolerance. Rings left with fewer than 4 points, or
+    smaller than the tolerance (e.g. small islands), are dropped, except the largest ring
+    of each polygon.
+    '''
+    keep = significance >= tolerance
+    part_ids = np.repeat(np.arange(len(parts) - 1), np.diff(parts))
+    counts = np.bincount(part_ids, weights=keep, minlength=len(parts) - 1).astype(np.int64)
+    if polygons:
+        part_keep = (counts >= 4) & ((part_size >= tolerance) | largest)
+    else:
+        part_keep = counts >= 2
+    keep &= part_keep[part_ids]
+    part_records = np.repeat(np.arange(len(records) - 1), np.diff(records))
+    new_parts = np.concatenate([[0], np.cumsum(counts[part_keep])])
+    new_records = np.concatenate([[0], np.cumsum(np.bincount(part_records[part_keep], minlength=len(records) - 1))])
+    return coords[keep].astype(np.float32), new_parts.astype(np.int32), new_records.astype(np.int32)
+
+def _lod_path(path):
+    root = path[:-4] if path.lower().endswith('.shp') else path
+    return root, root + '_lod.npz'
+
+def build_lod_cache(path, tolerances=DEFAULT_TOLERANCES):
+    '''
+    Simplifies a layer at every tolerance and saves the levels in one .npz file next
+    to it, with float32 coordinates and int32 offsets.
+
+    Input:
+        path (str): path to the layer, with or without the .shp extension
+        tolerances (tuple, default DEFAULT_TOLERANCES): tolerance of each level, increasing
+
+    Output: None
+    '''
+    root, cache_path = _lod_path(path)
+    with shp.ShapeFile(root) as layer:
+        coords, parts, records = layer.read()
+        bboxes = layer.bounding_boxes()
+        polygons = layer.shape_type in POLYGON_TYPES
+    fixed = _fixed_vertices(coords, parts) if polygons else None
+    significance = vertex_significance(coords, parts, fixed)
+    #size (bounding box diagonal) of each part, and the largest part of each record
+    part_ids = np.repeat(np.arange(len(parts) - 1), np.diff(parts))
+    filled = np.diff(parts) > 0
+    low = np.full((len(parts) - 1, 2), np.nan)
+    high = np.full((len(parts) - 1, 2), np.nan)
+    low[filled] = np.minimum.reduceat(coords, parts[:-1][filled])
+    high[filled] = np.maximum.reduceat(coords, parts[:-1][filled])
+    part_size = np.hypot(*(high - low).T)
+    part_records = np.repeat(np.arange(len(records) - 1), np.diff(records))
+    order = np.lexsort((-np.nan_to_num(part_size, nan=-1), part_records))
+    largest = np.zeros(len(parts) - 1, dtype=bool)
+    largest[order[np.searchsorted(part_records[order], np.arange(len(records) - 1))[np.diff(records) > 0]]] = True
+    if polygons:
+        #the largest ring of each polygon keeps its 2 most significant vertices besides
+        #its ends, so it is never reduced to less than a triangle
+        ends = np.zeros(len(coords), dtype=bool)
+        ends[parts[:-1]] = True
+        ends[parts[1:] - 1] = True
+        candidates = np.nonzero(largest[part_ids] & ~ends)[0]
+        candidates = candidates[np.lexsort((-significance[candidates], part_ids[candidates]))]
+        rank = np.arange(len(candidates)) - np.searchsorted(part_ids[candidates], part_ids[candidates])
+        significance[candidates[rank < 2]] = np.inf
+    levels = {}
+    #a level identical to the previous one (e.g. straight road segments, which cannot be
+    #simplified) is not stored again, level_index gives the stored level of each level
+    level_index = np.zeros(len(tolerances), dtype=np.int64)
+    previous = None
+    for k, tolerance in enumerate(tolerances):
+        level = _level(coords, parts, records, significance, part_size, largest, tolerance, polygons)
+        if previous is not None and all(np.array_equal(a, b) for a, b in zip(level, previous)):
+            level_index[k] = level_index[k - 1]
+            continue
+        level_index[k] = k
+        levels[f'coords_{k}'], levels[f'parts_{k}'], levels[f'records_{k}'] = level
+        previous = level
+    np.savez(cache_path, shp_mtime=os.path.getmtime(root + '.shp'), shx_mtime=os.path.getmtime(root + '.shx'),
+             tolerances=np.asarray(tolerances, dtype=np.float64), level_index=level_index, bboxes=bboxes, **levels)
+
+class GeometryCache:
+    '''
+    Simplified versions of a layer at several levels of detail, read from the cache file
+    next to the layer (built first if it is missing, if the .shp or .shx file has changed
+    since, or if it was built with other tolerances). The levels are loaded when first used.
+
+    Input:
+        path (str): path to the layer, with or without the .shp extension
+            (e.g. shapefile.LAD_FILE or shapefile.MRDB_FILE)
+        tolerances (tuple, default DEFAULT_TOLERANCES): tolerance of each level, increasing
+    '''
+
+    def __init__(self, path, tolerances=DEFAULT_TOLERANCES):
+        root, self.cache_path = _lod_path(path)
+        tolerances = np.asarray(tolerances, dtype=np.float64)
+        index = None
+        if os.path.exists(self.cache_path):
+            with np.load(self.cache_path) as f:
+                index = {key: f[key] for key in ('shp_mtime', 'shx_mtime', 'tolerances', 'level_index', 'bboxes')}
+            if (index['shp_mtime'] != os.path.getmtime(root + '.shp') or
+                    index['shx_mtime'] != os.path.getmtime(root + '.shx') or
+                    not np.array_equal(index['tolerances'], tolerances)):
+                index = None
+        if index is None:
+            build_lod_cache(root, tolerances)
+            with np.load(self.cache_path) as f:
+                index = {key: f[key] for key in ('tolerances', 'level_index', 'bboxes')}
+        self.tolerances = index['tolerances']
+        self.level_index = index['level_index']
+        self.bboxes = index['bboxes']
+        self.grid = None
+        self.levels = {}
+
+    def level(self, k):
+        '''
+        Returns level k as coords (float32), parts and records (int32), in the layout
+        of shapefile.ShapeFile.read().
+        '''
+        k = int(self.level_index[k])
+        if k not in self.levels:
+            with np.load(self.cache_path) as f:
+                self.levels[k] = (f[f'coords_{k}'], f[f'parts_{k}'], f[f'records_{k}'])
+        return self.levels[k]
+
+    def level_for_scale(self, scale, pixel_tolerance=0.5):
+        '''
+        Chooses the coarsest level whose error is not visible at a given scale.
+
+        Input:
+            scale (float): map units (metres) per pixel of the viewport
+            pixel_tolerance (float, default 0.5): largest error allowed, in pixels
+
+        Output: k (int): the level to draw (level 0, the finest, if even its error
+            would be visible)
+        '''
+        return max(int(np.searchsorted(self.tolerances, scale * pixel_tolerance, side='right') - 1), 0)
+
+    def for_viewport(self, bbox, width, pixel_tolerance=0.5):
+        '''
+        Returns the geometry to draw a viewport: the records meeting it, at the level
+        matching its scale.
+
+        Input:
+            bbox (tuple): the viewport (xmin, ymin, xmax, ymax), in map units
+            width (int): width of the viewport, in pixels
+            pixel_tolerance (float, default 0.5): largest error allowed, in pixels
+
+        Output:
+            coords, parts, records (ndarray): the simplified records, as in level()
+            indices (ndarray): the index of each record in the layer
+        '''
+        k = self.level_for_scale((bbox[2] - bbox[0]) / width, pixel_tolerance)
+        if self.grid is None:
+            self.grid = GridIndex(self.bboxes)
+        indices = self.grid.query(bbox)
+        coords, parts, records = _select(*self.level(k), indices)
+        return coords, parts, records, indices
@@ -0,0 +1,324 @@
+# Spatial indexes over the road and district layers, for fast road-in-district queries.
+import numpy as np
+from transit import shapefile as shp
+
+class GridIndex:
+    '''
+    Uniform grid over bounding boxes. Each box is listed in every cell it overlaps
+    (cells are stored CSR-style: the boxes of cell c are items[cell_start[c]:cell_start[c+1]]),
+    so the candidates of a query are found without looking at every box.
+
+    Input:
+        bboxes (ndarray): (xmin, ymin, xmax, ymax) of each item, NaN rows are never returned
+        cell_size (float, default None): side of a grid cell, if None chosen so that
+            there is about one item per cell
+    '''
+
+    def __init__(self, bboxes, cell_size=None):
+        self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        ids = np.nonzero(~np.isnan(self.bboxes).any(axis=1))[0]
+        boxes = self.bboxes[ids]
+        if len(ids):
+            self.origin = boxes[:, :2].min(axis=0)
+            extent = boxes[:, 2:].max(axis=0) - self.origin
+        else:
+            self.origin = np.zeros(2)
+            extent = np.zeros(2)
+        if cell_size is None:
+            cell_size = np.sqrt(max(extent[0], 1.0) * max(extent[1], 1.0) / max(len(ids), 1))
+        self.cell_size = float(cell_size)
+        self.shape = (extent // self.cell_size).astype(np.int64) + 1
+        #every (cell, item) pair, from the range of cells covered by each box
+        lo = self._cells(boxes[:, :2])
+        span = self._cells(boxes[:, 2:]) - lo + 1
+        counts = span[:, 0] * span[:, 1]
+        item = np.repeat(np.arange(len(ids)), counts)
+        k = shp._ranges(np.zeros(len(ids)), counts)
+        cells = self._cell_id(lo[item, 0] + k % span[item, 0], lo[item, 1] + k // span[item, 0])
+        order = np.argsort(cells, kind='stable')
+        self.items = ids[item[order]]
+        self.cell_start = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=self.shape.prod()))])
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def _cells(self, xy):
+        return np.clip(((xy - self.origin) // self.cell_size).astype(np.int64), 0, self.shape - 1)
+
+    def _cell_id(self, cx, cy):
+        return cy * self.shape[0] + cx
+
+    def query_points(self, points):
+        '''
+        Finds the items whose bounding box contains each point.
+
+        Input:
+            points (ndarray): (n, 2) x, y coordinates
+
+        Output:
+            point_ids, item_ids (ndarray): one (point, item) pair per match
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        cells = self._cells(points)
+        cells = self._cell_id(cells[:, 0], cells[:, 1])
+        counts = self.cell_start[cells + 1] - self.cell_start[cells]
+        point_ids = np.repeat(np.arange(len(points)), counts)
+        item_ids = self.items[shp._ranges(self.cell_start[cells], counts)]
+        boxes = self.bboxes[item_ids]
+        xy = points[point_ids]
+        match = ((boxes[:, 0] <= xy[:, 0]) & (xy[:, 0] <= boxes[:, 2]) &
+                 (boxes[:, 1] <= xy[:, 1]) & (xy[:, 1] <= boxes[:, 3]))
+        return point_ids[match], item_ids[match]
+
+    def query_boxes(self, bboxes):
+        '''
+        Finds the items whose bounding box intersects each query box.
+
+        Input:
+            bboxes (ndarray): (n, 4) query boxes, (xmin, ymin, xmax, ymax)
+
+        Output:
+            box_ids, item_ids (ndarray): one (box, item) pair per match, sorted by box
+                then item (each pair once)
+        '''
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        lo = self._cells(bboxes[:, :2])
+        span = self._cells(bboxes[:, 2:]) - lo + 1
+        counts = span[:, 0] * span[:, 1]
+        box = np.repeat(np.arange(len(bboxes)), counts)
+        k = shp._ranges(np.zeros(len(bboxes)), counts)
+        cells = self._cell_id(lo[box, 0] + k % span[box, 0], lo[box, 1] + k // span[box, 0])
+        cell_counts = self.cell_start[cells + 1] - self.cell_start[cells]
+        box_ids = np.repeat(box, cell_counts)
+        item_ids = self.items[shp._ranges(self.cell_start[cells], cell_counts)]
+        #an item spanning several cells is found once per cell
+        pairs = np.unique(box_ids * len(self) + item_ids)
+        box_ids, item_ids = pairs // max(len(self), 1), pairs % max(len(self), 1)
+        query = bboxes[box_ids]
+        boxes = self.bboxes[item_ids]
+        match = ((boxes[:, 0] <= query[:, 2]) & (query[:, 0] <= boxes[:, 2]) &
+                 (boxes[:, 1] <= query[:, 3]) & (query[:, 1] <= boxes[:, 3]))
+        return box_ids[match], item_ids[match]
+
+    def query(self, bbox):
+        '''
+        Returns the items whose bounding box intersects bbox (xmin, ymin, xmax, ymax), sorted.
+        '''
+        return self.query_boxes([bbox])[1]
+
+class PolygonIndex:
+    '''
+    Polygon layer (e.g. the LAD boundaries) with a grid of their bounding boxes, to find
+    which polygon each point falls in. Candidates come from the grid and are refined
+    with a vectorized even-odd (ray crossing) test. The edges of each polygon are also
+    sorted into horizontal bands, so a point is only tested against the edges of the
+    band it is in rather than against the whole boundary.
+
+    Input:
+        coords, parts, records (ndarray): the layer, as returned by shapefile.read_shapefile()
+        cell_size (float, default None): grid cell size (see GridIndex)
+        bands (int, default None): number of horizontal bands, if None one per 32 edges
+        max_edges (int, default 2**22): number of (point, edge) tests done at once,
+            bounds the memory used by contains()
+    '''
+
+    def __init__(self, coords, parts, records, cell_size=None, bands=None, max_edges=2**22):
+        self.coords = coords
+        self.parts = parts
+        self.records = records
+        self.max_edges = max_edges
+        #bounding box of each polygon (the points of the records follow each other in coords)
+        first, last = parts[records[:-1]], parts[records[1:]]
+        bboxes = np.full((len(records) - 1, 4), np.nan)
+        filled = last > first
+        if filled.any():
+            bboxes[filled, :2] = np.minimum.reduceat(coords, first[filled])
+            bboxes[filled, 2:] = np.maximum.reduceat(coords, first[filled])
+        self.grid = GridIndex(bboxes, cell_size)
+        #edge e joins coords[e] and coords[e + 1], except at the end of a part (ring)
+        edge_valid = np.ones(len(coords), dtype=bool)
+        edge_valid[parts[1:] - 1] = False
+        edge_polygon = np.repeat(np.arange(len(self)), last - first)
+        edges = np.nonzero(edge_valid)[0]
+        #horizontal edges never straddle the horizontal line through a point
+        edges = edges[coords[edges, 1] != coords[edges + 1, 1]]
+        #(polygon, band) of every band each edge crosses, sorted CSR-style
+        self.bands = int(bands if bands is not None else max(len(edges) // 32, 1))
+        self.y0 = coords[:, 1].min() if len(coords) else 0.0
+        height = (coords[:, 1].max() - self.y0) if len(coords) else 0.0
+        self.band_height = max(height, 1.0) / self.bands
+        y1, y2 = coords[edges, 1], coords[edges + 1, 1]
+        lo = self._band(np.minimum(y1, y2))
+        counts = self._band(np.maximum(y1, y2)) - lo + 1
+        edge_ids = np.repeat(edges, counts)
+        keys = edge_polygon[edge_ids] * self.bands + np.repeat(lo, counts) + shp._ranges(np.zeros(len(edges)), counts)
+        order = np.argsort(keys, kind='stable')
+        edge_ids = edge_ids[order]
+        #edge start, y range and inverse slope, stored in band order for contiguous reads
+        x1, y1 = coords[edge_ids, 0], coords[edge_ids, 1]
+        x2, y2 = coords[edge_ids + 1, 0], coords[edge_ids + 1, 1]
+        self.edges = np.stack([x1, y1, y2, (x2 - x1) / (y2 - y1)], axis=1)
+        self.edge_start = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=len(self) * self.bands))])
+
+    def __len__(self):
+        return len(self.records) - 1
+
+    def _band(self, y):
+        return np.clip(((y - self.y0) // self.band_height).astype(np.int64), 0, self.bands - 1)
+
+    def contains(self, points, polygons):
+        '''
+        Tests whether each point is inside the matching polygon (even-odd rule, so holes
+        are outside), for many (point, polygon) pairs at once.
+
+        Input:
+            points (ndarray): (n, 2) x, y coordinates
+            polygons (ndarray): index of the polygon to test each point against
+
+        Output: inside (ndarray): boolean, one per point
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        polygons = np.asarray(polygons, dtype=np.int64)
+        #the edges of the polygon in the band of the point
+        keys = polygons * self.bands + self._band(points[:, 1])
+        first = self.edge_start[keys]
+        counts = self.edge_start[keys + 1] - first
+        inside = np.zeros(len(points), dtype=bool)
+        #splits the pairs so that at most about max_edges edges are tested at once
+        total = np.cumsum(counts)
+        bounds = np.searchsorted(total, np.arange(self.max_edges, total[-1] if len(total) else 0, self.max_edges))
+        for chunk in np.split(np.arange(len(points)), np.unique(bounds)):
+            if not len(chunk):
+                continue
+            pair = np.repeat(np.arange(len(chunk)), counts[chunk])
+            x1, y1, y2, slope = self.edges[shp._ranges(first[chunk], counts[chunk])].T
+            x, y = np.repeat(points[chunk], counts[chunk], axis=0).T
+            #edges straddling the horizontal line through the point, crossed to its right
+            crossing = ((y1 > y) != (y2 > y)) & (x < x1 + (y - y1) * slope)
+            inside[chunk] = np.bincount(pair, weights=crossing, minlength=len(chunk)) % 2 == 1
+        return inside
+
+    def locate(self, points, polygons=None):
+        '''
+        Finds the polygon each point falls in.
+
+        Input:
+            points (ndarray): (n, 2) x, y coordinates
+            polygons (array, default None): if specified, only look for these polygons
+
+        Output: polygon_ids (ndarray): index of the polygon containing each point, -1 if none
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        point_ids, polygon_ids = self.grid.query_points(points)
+        if polygons is not None:
+            wanted = np.zeros(len(self), dtype=bool)
+            wanted[polygons] = True
+            keep = wanted[polygon_ids]
+            point_ids, polygon_ids = point_ids[keep], polygon_ids[keep]
+        inside = self.contains(points[point_ids], polygon_ids)
+        located = np.full(len(points), -1, dtype=np.int64)
+        located[point_ids[inside]] = polygon_ids[inside]
+        return located
+
+class RoadDistrictIndex:
+    '''
+    Spatial index over the MRDB roads and the LAD districts: a grid of the road bounding
+    boxes and a PolygonIndex of the district boundaries, with the district codes and
+    names from the LAD attribute table.
+
+    Input:
+        road_file (str, default shapefile.MRDB_FILE): the road layer
+        district_file (str, default shapefile.LAD_FILE): the district layer
+        csv_file (str, default shapefile.LAD_CSV_FILE): attribute table of the districts
+    '''
+
+    def __init__(self, road_file=shp.MRDB_FILE, district_file=shp.LAD_FILE, csv_file=shp.LAD_CSV_FILE):
+        with shp.ShapeFile(road_file) as roads:
+            self.road_coords, self.road_parts, self.road_records = roads.read()
+            self.roads = GridIndex(roads.bounding_boxes())
+        #road of each point
+        points_per_road = self.road_parts[self.road_records[1:]] - self.road_parts[self.road_records[:-1]]
+        self.point_road = np.repeat(np.arange(len(points_per_road)), points_per_road)
+        self.districts = PolygonIndex(*shp.read_shapefile(district_file))
+        self.attributes = shp.read_attributes(csv_file)
+        self.codes = self.attributes['LAD17CD']
+        self.names = self.attributes['LAD17NM']
+
+    def find_districts(self, prefix=None, codes=None):
+        '''
+        Returns the indices of the districts whose LAD17CD code starts with prefix
+        (e.g. 'S12' for Scotland) or is one of codes. All districts if neither is given.
+        '''
+        selected = np.ones(len(self.codes), dtype=bool)
+        if prefix is not None:
+            selected &= np.char.startswith(self.codes, prefix)
+        if codes is not None:
+            selected &= np.isin(self.codes, codes)
+        return np.nonzero(selected)[0]
+
+    def locate_roads(self, roads=None, districts=None):
+        '''
+        Finds the district each point of the roads falls in.
+
+        Input:
+            roads (array, default None): the roads to locate, all of them if None
+            districts (array, default None): only look for these districts, all if None
+
+        Output:
+            point_roads (ndarray): road of each point
+            point_districts (ndarray): district of each point, -1 if none
+        '''
+        if roads is None:
+            point_ids = np.arange(len(self.road_coords))
+        else:
+            roads = np.asarray(roads, dtype=np.int64)
+            first = self.road_parts[self.road_records[roads]]
+            point_ids = shp._ranges(first, self.road_parts[self.road_records[roads + 1]] - first)
+        return self.point_road[point_ids], self.districts.locate(self.road_coords[point_ids], districts)
+
+    def roads_in_districts(self, districts, predicate='any'):
+        '''
+        Finds the roads that fall in some districts.
+
+        Input:
+            districts (array): indices of the districts (see find_districts())
+            predicate (str, default 'any'): 'any' to keep the roads with at least one point
+                in the districts, 'all' for the roads entirely in them
+
+        Output: roads (ndarray): sorted indices of the roads (MRDB records)
+        '''
+        districts = np.asarray(districts, dtype=np.int64)
+        #candidates: the roads whose bounding box meets a district's
+        candidates = np.unique(self.roads.query_boxes(self.districts.grid.bboxes[districts])[1])
+        point_roads, point_districts = self.locate_roads(candidates, districts)
+        #one count per road (road_records holds the offset of each road, plus the total)
+        num_roads = len(self.road_records) - 1
+        inside = np.bincount(point_roads, weights=point_districts >= 0, minlength=num_roads)
+        if predicate == 'any':
+            return np.nonzero(inside > 0)[0]
+        if predicate == 'all':
+            total = np.bincount(point_roads, minlength=num_roads)
+            return np.nonzero((total > 0) & (inside == total))[0]
+        raise ValueError("predicate must be 'any' or 'all'")
+
+def build_region_index(prefix='S12', index_file=None, index=None, predicate='any'):
+    '''
+    Lists the MRDB roads in the districts whose LAD17CD starts with prefix, e.g. the
+    roads in Scotland (S12) as in shapefile.SCOTLAND_ROADS_FILE.
+
+    Input:
+        prefix (str, default 'S12'): start of the LAD17CD codes of the region
+        index_file (str, default None): if specified, save the indices there, in the
+            same format as scotland_roads_inx.txt (see shapefile.load_indices())
+        index (RoadDistrictIndex, default None): index to query, built if None
+        predicate (str, default 'any'): see RoadDistrictIndex.roads_in_districts()
+
+    Output: roads (ndarray): sorted indices of the roads in the region
+    '''
+    if index is None:
+        index = RoadDistrictIndex()
+    roads = index.roads_in_districts(index.find_districts(prefix), predicate)
+    if index_file is not None:
+        with open(index_file, 'w') as f:
+            f.write('[' + ', '.join(map(str, roads.tolist())) + ']')
+    return roads